@@ -0,0 +1,87 @@
+"""
+Benchmark the concatenation of joinExisting aggregation members, with the defaults of `xr.concat` and with
+`compat="override"`.
+
+Members hold variables along time, and variables shared by all members: 2D latitude and longitude coordinates, and a
+grid mapping. With the defaults of `xr.concat`, shared variables are loaded and compared across members; with
+`compat="override"`, they are taken from the first member.
+
+Usage::
+
+    python benchmarks/bench_concat.py [n_members ...]
+"""
+
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import xarray as xr
+
+import xncml
+
+
+NS = "http://www.unidata.ucar.edu/namespaces/netcdf/ncml-2.2"
+NT = 24
+NY, NX = 100, 200
+
+
+def write_members(path: Path, n: int) -> Path:
+    """Write `n` member files with `NT` time steps each, and return the aggregation scanning them."""
+    path.mkdir()
+    y, x = np.meshgrid(np.arange(NY, dtype="float64"), np.arange(NX, dtype="float64"), indexing="ij")
+    for i in range(n):
+        time = np.arange(i * NT, (i + 1) * NT, dtype="int32")
+        ds = xr.Dataset(
+            {name: (("time", "y", "x"), np.zeros((NT, NY, NX), "float32"), {"grid_mapping": "crs"}) for name in ("tas", "pr", "huss")},
+            coords={
+                "time": ("time", time, {"units": "hours since 2000-01-01"}),
+                "lat": (("y", "x"), 40 + y / 10),
+                "lon": (("y", "x"), -100 + x / 10),
+            },
+        )
+        ds["crs"] = ((), 0, {"grid_mapping_name": "rotated_latitude_longitude"})
+        ds.to_netcdf(path / f"member_{i:05d}.nc")
+
+    fn = path / "agg.ncml"
+    fn.write_text(
+        f"""<?xml version="1.0" encoding="UTF-8"?>
+<netcdf xmlns="{NS}">
+  <aggregation dimName="time" type="joinExisting">
+    <scan location="." suffix=".nc"/>
+  </aggregation>
+</netcdf>
+"""
+    )
+    return fn
+
+
+def timeit(fn: Path, repeat: int = 3, **kwargs) -> float:
+    """Return best wall time of `repeat` calls to `open_ncml`."""
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        ds = xncml.open_ncml(fn, **kwargs)
+        best = min(best, time.perf_counter() - t0)
+        ds.close()
+    return best
+
+
+def main(sizes):
+    """Print times to open aggregations of the given sizes."""
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in sizes:
+            fn = write_members(Path(tmp) / f"members_{n}", n)
+            print(f"{n:>8} members")
+            for lazy in (False, True):
+                ref = None
+                for label, compat in [("default", None), ("override", "override")]:
+                    elapsed = timeit(fn, lazy_members=lazy, compat=compat)
+                    ref = ref or elapsed
+                    mode = "lazy" if lazy else "eager"
+                    print(f"    {mode:<6} {label:<10} {elapsed:8.3f} s  {ref / elapsed:5.1f}x")
+
+
+if __name__ == "__main__":
+    main([int(n) for n in sys.argv[1:]] or [100, 500])
@@ -0,0 +1,49 @@
+"""
+Benchmark the reading of NcML documents making many edits to a dataset, here groups of variables defined in the
+document and flattened into a single dataset.
+
+Edits are collected in a `xncml.plan.Plan` and applied at once. Set the `XNCML_DEBUG_PLAN` environment variable to
+print the plans.
+
+Usage::
+
+    python benchmarks/bench_edits.py [n_groups ...]
+"""
+
+import sys
+import time
+
+import xncml
+
+
+NS = "http://www.unidata.ucar.edu/namespaces/netcdf/ncml-2.2"
+NVARS = 100
+
+
+def document(n: int) -> str:
+    """Return NcML document with `n` groups of `NVARS` variables sharing the same names."""
+    variables = "".join(
+        f"""<variable name="v{i}" shape="x" type="float">
+          <attribute name="units" value="K" />
+          <values>{i}</values>
+        </variable>"""
+        for i in range(NVARS)
+    )
+    groups = "".join(f"""<group name="g{g}"><dimension name="x" length="1" />{variables}</group>""" for g in range(n))
+    return f"""<netcdf xmlns="{NS}">{groups}</netcdf>"""
+
+
+def main(sizes):
+    """Print times to open documents with the given numbers of groups."""
+    for n in sizes:
+        text = document(n)
+        best = float("inf")
+        for _ in range(3):
+            t0 = time.perf_counter()
+            ds = xncml.open_ncml(text, group="*")
+            best = min(best, time.perf_counter() - t0)
+        print(f"{n:>5} groups {len(ds.data_vars):>7} variables {best:8.3f} s")
+
+
+if __name__ == "__main__":
+    main([int(n) for n in sys.argv[1:]] or [10, 30])
@@ -0,0 +1,41 @@
+"""
+Benchmark the import time of xncml for common entry points.
+
+Usage::
+
+    python benchmarks/bench_import.py [repeat]
+"""
+
+import subprocess
+import sys
+
+
+STATEMENTS = {
+    "import xncml": "import xncml",
+    "xncml.Dataset": "import xncml; xncml.Dataset",
+    "xncml.open_ncml": "import xncml; xncml.open_ncml",
+}
+
+
+def import_time(statement: str) -> float:
+    """Return total import time, in seconds, of the top-level modules imported by statement."""
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", statement], capture_output=True, text=True, check=True)  # noqa: S603
+    total = 0
+    for line in proc.stderr.splitlines():
+        if line.startswith("import time:") and "cumulative" not in line:
+            _, cumulative, name = line.removeprefix("import time:").split("|")
+            # Only count top-level imports, nested ones are included in their parent's cumulative time.
+            if not name.startswith("   ") and name.strip() not in ("site", "encodings", "sitecustomize", "usercustomize"):
+                total += int(cumulative)
+    return total * 1e-6
+
+
+def main(repeat: int):
+    """Print best import time of each statement over `repeat` fresh interpreters."""
+    for label, statement in STATEMENTS.items():
+        best = min(import_time(statement) for _ in range(repeat))
+        print(f"{label:<18} {best * 1e3:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5)
@@ -0,0 +1,105 @@
+"""
+Benchmark the time spent in `open_ncml` on a joinExisting aggregation of many files.
+
+Members are small netCDF files holding a few variables along time. The aggregation is opened eagerly, eagerly with
+eight threads, lazily with members probed for their layout, and lazily with every member annotated with `ncoords` and
+`coordValue`, in which case only the first file is opened. Threads mostly pay off on network file systems, where
+opening a file is dominated by latency. Each aggregation is then opened and loaded, which reads the data of every member, in
+chunks of a few time steps for lazy members.
+
+Usage::
+
+    python benchmarks/bench_open.py [n_members ...]
+"""
+
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import xarray as xr
+
+import xncml
+
+
+NS = "http://www.unidata.ucar.edu/namespaces/netcdf/ncml-2.2"
+NT = 24
+
+
+def write_members(path: Path, n: int) -> list[Path]:
+    """Write `n` member files with `NT` time steps each."""
+    path.mkdir()
+    fns = []
+    for i in range(n):
+        time = np.arange(i * NT, (i + 1) * NT, dtype="int32")
+        ds = xr.Dataset(
+            {name: (("time", "lat", "lon"), np.zeros((NT, 10, 20), "float32")) for name in ("tas", "pr", "huss", "uas", "vas")},
+            coords={"time": ("time", time, {"units": "hours since 2000-01-01"}), "lat": np.arange(10.0), "lon": np.arange(20.0)},
+        )
+        fns.append(path / f"member_{i:05d}.nc")
+        ds.to_netcdf(fns[-1])
+    return fns
+
+
+def write_catalog(path: Path, fns: list[Path], annotated: bool) -> Path:
+    """Write a joinExisting aggregation of the given files."""
+
+    def member(i, fn):
+        if annotated:
+            values = " ".join(map(str, range(i * NT, (i + 1) * NT)))
+            return f'    <netcdf location="{fn}" ncoords="{NT}" coordValue="{values}"/>'
+        return f'    <netcdf location="{fn}"/>'
+
+    members = "\n".join(member(i, fn) for i, fn in enumerate(fns))
+    path.write_text(
+        f"""<?xml version="1.0" encoding="UTF-8"?>
+<netcdf xmlns="{NS}">
+  <aggregation dimName="time" type="joinExisting">
+{members}
+  </aggregation>
+</netcdf>
+"""
+    )
+    return path
+
+
+def timeit(fn: Path, repeat: int = 3, load: bool = False, **kwargs) -> float:
+    """Return best wall time of `repeat` calls to `open_ncml`, followed by `load` if `load` is True."""
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        ds = xncml.open_ncml(fn, **kwargs)
+        if load:
+            ds.load()
+        best = min(best, time.perf_counter() - t0)
+        ds.close()
+    return best
+
+
+def main(sizes):
+    """Print times to open aggregations of the given sizes."""
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in sizes:
+            fns = write_members(Path(tmp) / f"members_{n}", n)
+            plain = write_catalog(Path(tmp) / f"plain_{n}.ncml", fns, annotated=False)
+            annotated = write_catalog(Path(tmp) / f"annotated_{n}.ncml", fns, annotated=True)
+            print(f"{n:>8} members")
+            cases = [
+                ("eager", plain, {}),
+                ("parallel", plain, {"parallel": 8}),
+                ("probed", plain, {"lazy_members": True}),
+                ("annotated", annotated, {"lazy_members": True}),
+            ]
+            for load in (False, True):
+                print("    open + load" if load else "    open")
+                ref = None
+                for label, fn, kwargs in cases:
+                    chunks = {"chunks": {"time": NT // 4}} if load and kwargs.get("lazy_members") else {}
+                    elapsed = timeit(fn, load=load, **kwargs, **chunks)
+                    ref = ref or elapsed
+                    print(f"      {label:<10} {elapsed:8.3f} s  {ref / elapsed:5.1f}x")
+
+
+if __name__ == "__main__":
+    main([int(n) for n in sys.argv[1:]] or [100, 1_000])
@@ -0,0 +1,82 @@
+"""
+Benchmark NcML parsing engines on large synthetic aggregation catalogs.
+
+For each engine, the best wall time of a full parse and the peak memory allocated while parsing the catalog and
+iterating over its members are reported.
+
+Usage::
+
+    python benchmarks/bench_parse.py [n_members ...]
+"""
+
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+from xncml.parser import parse
+
+
+NS = "http://www.unidata.ucar.edu/namespaces/netcdf/ncml-2.2"
+
+
+def write_catalog(path: Path, n: int) -> Path:
+    """Write a joinExisting aggregation listing `n` members."""
+    members = "\n".join(f'    <netcdf location="data/member_{i:06d}.nc" coordValue="{i}" ncoords="1"/>' for i in range(n))
+    path.write_text(
+        f"""<?xml version="1.0" encoding="UTF-8"?>
+<netcdf xmlns="{NS}">
+  <attribute name="title" value="Synthetic catalog"/>
+  <aggregation dimName="time" type="joinExisting">
+{members}
+  </aggregation>
+</netcdf>
+"""
+    )
+    return path
+
+
+def timeit(func, *args, repeat: int = 3, **kwargs) -> float:
+    """Return best wall time of `repeat` calls."""
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        func(*args, **kwargs)
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def consume(fn: Path, engine: str):
+    """Parse catalog and iterate over the members of its aggregation."""
+    obj = parse(fn, cache=False, engine=engine)
+    for _item in obj.choice[1].netcdf:
+        pass
+
+
+def peak_memory(func, *args, **kwargs) -> float:
+    """Return peak memory in MB allocated during call."""
+    tracemalloc.start()
+    try:
+        func(*args, **kwargs)
+        return tracemalloc.get_traced_memory()[1] / 2**20
+    finally:
+        tracemalloc.stop()
+
+
+def main(sizes):
+    """Print parsing times and peak memory of each engine for catalogs of the given sizes."""
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in sizes:
+            fn = write_catalog(Path(tmp) / f"catalog_{n}.ncml", n)
+            print(f"{n:>8} members")
+            ref = None
+            for engine in ("xsdata", "fast", "stream"):
+                elapsed = timeit(consume, fn, engine)
+                ref = ref or elapsed
+                mem = peak_memory(consume, fn, engine)
+                print(f"    {engine:<8} {elapsed:8.3f} s  {ref / elapsed:5.1f}x  peak {mem:8.1f} MB")
+
+
+if __name__ == "__main__":
+    main([int(n) for n in sys.argv[1:]] or [1_000, 10_000, 40_000])
@@ -0,0 +1,78 @@
+"""
+Benchmark directory scans on a large synthetic tree.
+
+The tree holds `n_entries` empty files spread over directories of 1000 entries, of which one in a hundred matches the
+scan suffix. The walker used by `read_scan` is compared to listing the whole tree with `Path.rglob` before filtering. Threads mostly
+pay off on network file systems, where listing a directory is dominated by latency.
+
+Usage::
+
+    python benchmarks/bench_scan.py [n_entries]
+"""
+
+import fnmatch
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from xncml.scan import matcher, walk
+
+
+PER_DIR = 1000
+
+
+def make_tree(root: Path, n: int) -> Path:
+    """Create `n` empty files under `root`, one in a hundred with the `.nc` suffix."""
+    for i in range(n):
+        d = root / f"d{i // PER_DIR // 100:03d}" / f"s{i // PER_DIR:05d}"
+        if i % PER_DIR == 0:
+            d.mkdir(parents=True)
+        ext = ".nc" if i % 100 == 0 else ".txt"
+        (d / f"f{i:07d}{ext}").touch()
+    return root
+
+
+def rglob(root: Path) -> list[str]:
+    """Scan as done before the walker: list the whole tree, then filter paths."""
+    files = list(root.rglob("*"))
+    files = fnmatch.filter(map(str, files), "*.nc")
+    files.sort()
+    return files
+
+
+def scan(root: Path, parallel=None) -> list[str]:
+    """Scan with the walker."""
+    entries, _ = walk(root, subdirs=True, match=matcher(suffix=".nc"), parallel=parallel)
+    return [entry.path for entry in entries]
+
+
+def timeit(func, *args, repeat: int = 3) -> float:
+    """Return best wall time of `repeat` calls."""
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        func(*args)
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def main(n: int):
+    """Print scan times of the synthetic tree."""
+    with tempfile.TemporaryDirectory() as tmp:
+        t0 = time.perf_counter()
+        root = make_tree(Path(tmp), n)
+        print(f"{n} entries created in {time.perf_counter() - t0:.1f} s")
+
+        if not rglob(root) == scan(root) == scan(root, 8):
+            raise RuntimeError("Scans disagree.")
+        ref = timeit(rglob, root)
+        print(f"    {'rglob':<12} {ref:8.3f} s")
+        for parallel in (None, 4, 8):
+            elapsed = timeit(scan, root, parallel)
+            label = f"walk({parallel})"
+            print(f"    {label:<12} {elapsed:8.3f} s  {ref / elapsed:5.1f}x")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000)
@@ -0,0 +1,49 @@
+"""
+Benchmark the parsing of large inline <values> elements, such as coordinate grids embedded in NcML documents.
+
+Numbers parsed by `xncml.parser.decode_values`, as done by `read_variable`, are compared with numbers converted from the
+list of strings split from the text, as done previously.
+
+Usage::
+
+    python benchmarks/bench_values.py [n_values ...]
+"""
+
+import sys
+import time
+
+import numpy as np
+
+from xncml.parser import decode_values
+
+
+def timeit(func, *args, repeat: int = 3) -> float:
+    """Return best wall time of `repeat` calls to `func`."""
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        func(*args)
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def split(text: str, dtype, separator: str) -> np.ndarray:
+    """Convert values by splitting the text into a list of strings."""
+    return np.dtype(dtype).type(text.split(separator))
+
+
+def main(sizes):
+    """Print times to parse values of the given sizes."""
+    rng = np.random.default_rng(0)
+    for n in sizes:
+        print(f"{n:>10} values")
+        for dtype, values in [("float64", rng.uniform(-180, 180, n)), ("int32", rng.integers(0, 100_000, n))]:
+            text = " ".join(map(str, values.tolist()))
+            ref = timeit(split, text, dtype, " ")
+            elapsed = timeit(decode_values, text, dtype, " ")
+            np.testing.assert_array_equal(decode_values(text, dtype, " "), values.astype(dtype))
+            print(f"    {dtype:<8} split {ref:8.3f} s  decode_values {elapsed:8.3f} s  {ref / elapsed:5.1f}x")
+
+
+if __name__ == "__main__":
+    main([int(n) for n in sys.argv[1:]] or [1_000_000, 5_000_000])
@@ -18,8 +18,39 @@
 # limitations under the License.
 ###################################################################################
 
-from .core import Dataset
-from .parser import open_ncml
+from __future__ import annotations
+import importlib
+from typing import TYPE_CHECKING, Any
 
 
+if TYPE_CHECKING:
+    from .core import Dataset
+    from .parser import AggregatedDataset, open_ncml
+
 __version__ = "0.5.1"
+
+# Public objects, imported on first access so that `import xncml` does not import xarray, numpy or xsdata.
+_LAZY_OBJECTS = {
+    "AggregatedDataset": ".parser",
+    "Dataset": ".core",
+    "open_ncml": ".parser",
+}
+
+# Submodules, also imported on first access, as they would be once imported by `__init__`.
+_LAZY_SUBMODULES = ("aggregation", "cache", "core", "fastparse", "parser", "plan", "scan")
+
+
+def __getattr__(name: str) -> Any:
+    """Import public objects and submodules on first access."""
+    if name in _LAZY_OBJECTS:
+        value = getattr(importlib.import_module(_LAZY_OBJECTS[name], __name__), name)
+        globals()[name] = value
+        return value
+    if name in _LAZY_SUBMODULES:
+        return importlib.import_module(f".{name}", __name__)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__() -> list[str]:
+    """Return module attributes, including objects and submodules not imported yet."""
+    return sorted(set(globals()) | set(_LAZY_OBJECTS) | set(_LAZY_SUBMODULES))
@@ -0,0 +1,499 @@
+"""
+# Lazy aggregation members
+
+The layout of a joinExisting aggregation only depends on the length of each member along the aggregation dimension and
+on the values of its coordinate. `probe` reads those from the header and coordinate variable of the member file with
+`netCDF4`, without decoding the metadata of the other variables. The first member is opened as a template for the
+structure and metadata of the aggregated dataset, and `member_dataset` wraps the variables of each member into dask
+arrays that only open the file when their data is computed, and keep it open in xarray's cache of files afterwards.
+
+Probing many files can still take a while on large archives. A `Manifest` keeps the layout of members on disk, so that
+only new or modified files are probed the next time the aggregation is opened.
+
+Once members are concatenated, a `MemberIndex` of the coordinate intervals they span is kept in the `encoding` of the
+aggregated dataset, telling which file holds a given coordinate value.
+"""
+
+from __future__ import annotations
+import dataclasses
+import hashlib
+import json
+import os
+import threading
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+import numpy as np
+import xarray as xr
+
+
+if TYPE_CHECKING:
+    from collections.abc import Iterable
+    from concurrent.futures import Executor
+
+    from xarray.backends import CachingFileManager
+
+
+@dataclasses.dataclass(frozen=True, eq=False)
+class Member:
+    """
+    Layout of an aggregation member along the aggregation dimension.
+
+    Parameters
+    ----------
+    location : str
+      Path to the member file.
+    size : int
+      Length of the aggregation dimension in the member.
+    coords : np.ndarray, optional
+      Values of the aggregation coordinate variable, if the member has one.
+    """
+
+    location: str
+    size: int
+    coords: np.ndarray | None = None
+
+
+def probe(location: str | Path, dim_name: str) -> Member:
+    """
+    Return the length of dimension `dim_name` in file and the values of its coordinate variable.
+
+    Only the file header and the coordinate variable are read.
+
+    Parameters
+    ----------
+    location : str | Path
+      Path to netCDF file.
+    dim_name : str
+      Name of the aggregation dimension.
+
+    Returns
+    -------
+    Member
+      Layout of the file along the aggregation dimension.
+    """
+    import netCDF4
+    from xarray.backends.netCDF4_ import NETCDF4_PYTHON_LOCK
+
+    location = str(location)
+    with NETCDF4_PYTHON_LOCK, netCDF4.Dataset(location) as nc:
+        if dim_name not in nc.dimensions:
+            raise ValueError(f"Dimension `{dim_name}` not found in {location}.")
+        size = len(nc.dimensions[dim_name])
+        var = nc.variables.get(dim_name)
+        if var is None or var.dimensions != (dim_name,):
+            coords = None
+        else:
+            # Missing values are left as is, and scale and offset applied, as by `xr.open_dataset`.
+            var.set_auto_mask(False)
+            coords = np.asarray(var[:])
+    return Member(location, size, coords)
+
+
+def probe_members(locations: Iterable[str | Path], dim_name: str, parallel: Executor | None = None) -> list[Member]:
+    """
+    Return the layout of each file along the aggregation dimension.
+
+    Parameters
+    ----------
+    locations : Iterable
+      Paths to netCDF files.
+    dim_name : str
+      Name of the aggregation dimension.
+    parallel : Executor, optional
+      Executor used to probe files concurrently.
+
+    Returns
+    -------
+    list of Member
+      Layout of each file, in the order of `locations`.
+    """
+    if parallel is None:
+        return [probe(loc, dim_name) for loc in locations]
+    return list(parallel.map(probe, locations, [dim_name] * len(locations)))
+
+
+class Manifest:
+    """
+    Persistent record of the layout of aggregation members.
+
+    Entries are keyed by the aggregation dimension and the member path, and are reused as long as the modification time
+    and size of the file are unchanged. Members whose coordinate values cannot be stored as JSON, such as bytes or
+    objects, are probed every time.
+
+    Parameters
+    ----------
+    path : str | Path
+      JSON file where the manifest is stored. It is created by `save` if it does not exist.
+    """
+
+    version = 1
+
+    def __init__(self, path: str | Path):
+        self.path = Path(path)
+        self.probed = 0
+        self._entries = self._load()
+        # Locations of the members probed or found in the manifest, by aggregation dimension.
+        self._members = {}
+        self._dirty = False
+        self._lock = threading.Lock()
+
+    @classmethod
+    def for_document(cls, content: bytes, cache_dir: str | Path | None = None) -> Manifest:
+        """
+        Return the manifest of an NcML document.
+
+        Parameters
+        ----------
+        content : bytes
+          NcML document, whose hash identifies the manifest.
+        cache_dir : str | Path, optional
+          Directory where manifests are stored. Defaults to the user cache directory, see `cache.user_cache_dir`.
+
+        Returns
+        -------
+        Manifest
+          Manifest of the document.
+        """
+        from .cache import user_cache_dir
+
+        key = hashlib.sha256(content).hexdigest()
+        return cls(Path(cache_dir or user_cache_dir()) / "manifests" / f"{key}.json")
+
+    def probe_members(
+        self, locations: Iterable[str | Path], dim_name: str, parallel: Executor | None = None, stats: dict | None = None
+    ) -> list[Member]:
+        """
+        Return the layout of each file along the aggregation dimension, probing only new or modified files.
+
+        Parameters
+        ----------
+        locations : Iterable
+          Paths to netCDF files.
+        dim_name : str
+          Name of the aggregation dimension.
+        parallel : Executor, optional
+          Executor used to probe files concurrently.
+        stats : dict, optional
+          `os.stat_result` of files already gathered, by path. Other files are stat'ed.
+
+        Returns
+        -------
+        list of Member
+          Layout of each file, in the order of `locations`.
+        """
+        locations = [str(loc) for loc in locations]
+        stats = stats or {}
+        stamps = {loc: _stamp(stats.get(loc) or Path(loc).stat()) for loc in locations}
+        with self._lock:
+            table = self._entries.setdefault(dim_name, {})
+            self._members.setdefault(dim_name, set()).update(locations)
+            members = {loc: _decode(loc, table[loc]) for loc in locations if table.get(loc, {}).get("stamp") == stamps[loc]}
+
+        missing = [loc for loc in locations if loc not in members]
+        for member in probe_members(missing, dim_name, parallel):
+            members[member.location] = member
+        with self._lock:
+            for loc in missing:
+                entry = _encode(members[loc], stamps[loc])
+                if entry is not None:
+                    table[loc] = entry
+                    self._dirty = True
+            self.probed += len(missing)
+        return [members[loc] for loc in locations]
+
+    def save(self):
+        """
+        Write the manifest to disk if it was modified.
+
+        Entries written by other processes since the manifest was loaded are kept, unless this manifest has newer entries
+        for the same files. Entries of files that no longer exist are dropped.
+        """
+        with self._lock:
+            if not self._dirty:
+                return
+            entries = {dim_name: dict(table) for dim_name, table in self._entries.items()}
+            members = {dim_name: set(locations) for dim_name, locations in self._members.items()}
+            self._dirty = False
+
+        for dim_name, table in self._load().items():
+            for loc, entry in table.items():
+                entries.setdefault(dim_name, {}).setdefault(loc, entry)
+        for dim_name, table in entries.items():
+            # Members were stat'ed when probed, other files are checked.
+            known = members.get(dim_name, set())
+            for loc in [loc for loc in table if loc not in known and not Path(loc).exists()]:
+                del table[loc]
+        content = json.dumps({"version": self.version, "entries": entries})
+
+        # Write to a temporary file first, so that concurrent readers never see a partial manifest.
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_name(f"{self.path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp.write_text(content)
+        tmp.replace(self.path)
+
+    def _load(self) -> dict:
+        try:
+            content = json.loads(self.path.read_text())
+        except (OSError, ValueError):
+            return {}
+        if content.get("version") != self.version:
+            return {}
+        return content["entries"]
+
+
+def _stamp(st: os.stat_result) -> list[int]:
+    return [st.st_mtime_ns, st.st_size]
+
+
+def _encode(member: Member, stamp: list[int]) -> dict | None:
+    entry = {"stamp": stamp, "size": member.size, "coords": None}
+    if member.coords is not None:
+        # Members are not recorded if `tolist` does not return JSON types, as for bytes, objects or dates.
+        if member.coords.dtype.kind not in "biufU":
+            return None
+        entry["coords"] = member.coords.tolist()
+        entry["dtype"] = member.coords.dtype.str
+    return entry
+
+
+def _decode(location: str, entry: dict) -> Member:
+    coords = entry["coords"]
+    if coords is not None:
+        coords = np.array(coords, dtype=entry["dtype"])
+    return Member(location, entry["size"], coords)
+
+
+class MemberArray:
+    """
+    Array of a member variable, read from file when indexed.
+
+    Parameters
+    ----------
+    location : str
+      Path to the member file.
+    name : str
+      Variable name.
+    shape : tuple of int
+      Variable shape.
+    dtype : np.dtype
+      Variable type, once decoded by `xr.open_dataset`.
+    manager : CachingFileManager, optional
+      Manager of the dataset of the member file, shared by the variables of the member so that the file is opened once
+      rather than for each chunk read.
+    """
+
+    def __init__(self, location: str, name: str, shape: tuple[int, ...], dtype: np.dtype, manager: CachingFileManager | None = None):
+        self.location = location
+        self.name = name
+        self.shape = shape
+        self.dtype = np.dtype(dtype)
+        self.ndim = len(shape)
+        self.manager = manager or member_file_manager(location)
+
+    def __getitem__(self, key) -> np.ndarray:
+        """Return values of variable read from file."""
+        # Only the requested values of the variable are read, under the lock of the backend.
+        return self.manager.acquire()[self.name].variable[key].values
+
+    def __repr__(self) -> str:
+        """Return string representation."""
+        return f"{type(self).__name__}({self.location!r}, {self.name!r}, shape={self.shape}, dtype={self.dtype})"
+
+
+def member_file_manager(location: str) -> CachingFileManager:
+    """
+    Return manager of the dataset of a member file, kept open in xarray's cache of files while it is read.
+
+    Parameters
+    ----------
+    location : str
+      Path to the member file.
+
+    Returns
+    -------
+    CachingFileManager
+      Manager opening the file with `xr.open_dataset` when first acquired, and reopening it if it was closed since.
+    """
+    from xarray.backends import CachingFileManager
+
+    from .parser import _open_dataset
+
+    return CachingFileManager(_open_dataset, location, kwargs={"decode_times": False})
+
+
+def member_dataset(template: xr.Dataset, member: Member, dim_name: str, chunks: int | dict | str | None = None) -> xr.Dataset:
+    """
+    Return dataset with the structure of `template`, holding the data of `member` along the aggregation dimension.
+
+    Variables along the aggregation dimension are dask arrays reading the member file when computed. Following the
+    NcML specification, other variables are taken from the template.
+
+    Parameters
+    ----------
+    template : xr.Dataset
+      Dataset with the variables, dimensions and metadata shared by all aggregation members.
+    member : Member
+      Layout of member along the aggregation dimension.
+    dim_name : str
+      Name of the aggregation dimension.
+    chunks : int | dict | str, optional
+      Chunk sizes of the dask arrays, as given to `xr.open_dataset`. By default, variables are read as a single chunk.
+      Dimensions left out of a dictionary span the whole file.
+
+    Returns
+    -------
+    xr.Dataset
+      Member dataset.
+    """
+    import dask.array as da
+    from dask.base import tokenize
+
+    manager = member_file_manager(member.location)
+    variables = {}
+    for name, var in template.variables.items():
+        if dim_name not in var.dims:
+            variables[name] = var
+            continue
+
+        if name == dim_name and member.coords is not None:
+            data = member.coords
+        else:
+            shape = tuple(member.size if dim == dim_name else n for dim, n in zip(var.dims, var.shape, strict=True))
+            if isinstance(chunks, dict):
+                var_chunks = tuple(chunks.get(dim, -1) for dim in var.dims)
+            else:
+                var_chunks = -1 if chunks is None else chunks
+            data = da.from_array(
+                MemberArray(member.location, name, shape, var.dtype, manager),
+                chunks=var_chunks,
+                name=f"xncml-{name}-{tokenize(member.location, name, shape, str(var.dtype))}",
+                meta=np.empty((0,) * len(shape), dtype=var.dtype),
+            )
+        variables[name] = (var.dims, data, var.attrs, var.encoding)
+
+    coords = {name: variables.pop(name) for name in template.coords}
+    ds = xr.Dataset(variables, coords=coords, attrs=template.attrs)
+    # As for datasets opened by `xr.open_dataset`.
+    ds.encoding["source"] = member.location
+    ds.set_close(manager.close)
+    return ds
+
+
+class MemberIndex:
+    """
+    Sorted intervals of the coordinate values spanned by the members of a joinExisting aggregation.
+
+    Lookups are binary searches over the intervals, assuming that members do not overlap and that coordinate values
+    increase within each member.
+
+    Parameters
+    ----------
+    locations : list of str or None
+      Path to the file of each member, in the order of the aggregation. None for members that are not a single file.
+    sizes : sequence of int
+      Length of the aggregation dimension in each member.
+    coords : np.ndarray
+      Coordinate values of all members, concatenated in the order of the aggregation.
+    """
+
+    def __init__(self, locations: list[str | None], sizes: Iterable[int], coords: np.ndarray):
+        self.locations = list(locations)
+        self.sizes = np.asarray(sizes, dtype=int)
+        self.coords = np.asarray(coords)
+        # Position of the first element of each member along the aggregation dimension.
+        self.offsets = np.concatenate([[0], np.cumsum(self.sizes)[:-1]]).astype(int)
+
+        nonempty = np.flatnonzero(self.sizes)
+        starts = np.array([self.coords[self.offsets[i] : self.offsets[i] + self.sizes[i]].min() for i in nonempty])
+        ends = np.array([self.coords[self.offsets[i] : self.offsets[i] + self.sizes[i]].max() for i in nonempty])
+        order = np.argsort(starts, kind="stable")
+        self._order = nonempty[order]
+        self.starts = starts[order]
+        self.ends = ends[order]
+
+    @classmethod
+    def from_datasets(cls, datasets: list[xr.Dataset], dim_name: str, coords: np.ndarray | None = None) -> MemberIndex | None:
+        """
+        Return index of aggregation members, or None if the coordinates of members are not all in memory, or cannot be
+        compared, as dates of different calendars.
+
+        Parameters
+        ----------
+        datasets : list of xr.Dataset
+          Members, in the order of the aggregation. Their file is given by `encoding["source"]`.
+        dim_name : str
+          Name of the aggregation dimension.
+        coords : np.ndarray, optional
+          Coordinate values of all members, concatenated, if they differ from those of `datasets`, for instance once
+          decoded.
+
+        Returns
+        -------
+        MemberIndex or None
+          Index of members.
+        """
+        if not datasets:
+            return None
+        if coords is None:
+            if not all(dim_name in ds.indexes for ds in datasets):
+                return None
+            coords = np.concatenate([ds.indexes[dim_name].to_numpy() for ds in datasets])
+        try:
+            return cls([ds.encoding.get("source") for ds in datasets], [ds.sizes[dim_name] for ds in datasets], coords)
+        except TypeError:
+            return None
+
+    def extend(self, other: MemberIndex) -> MemberIndex:
+        """Return index of the members of `self`, followed by those of `other`."""
+        return type(self)(self.locations + other.locations, np.concatenate([self.sizes, other.sizes]), np.concatenate([self.coords, other.coords]))
+
+    def locate(self, value) -> tuple[str | None, int]:
+        """
+        Return the member holding a coordinate value.
+
+        Parameters
+        ----------
+        value : scalar
+          Coordinate value.
+
+        Returns
+        -------
+        str or None
+          Path to the member file.
+        int
+          Position within the member of the last coordinate value that is not greater than `value`.
+        """
+        i = np.searchsorted(self.starts, value, side="right") - 1
+        if i < 0 or value > self.ends[i]:
+            raise KeyError(f"{value!r} is not within any aggregation member.")
+        member = self._order[i]
+        offset, size = self.offsets[member], self.sizes[member]
+        position = np.searchsorted(self.coords[offset : offset + size], value, side="right") - 1
+        return self.locations[member], int(position)
+
+    def members_for(self, key: slice) -> list[str | None]:
+        """
+        Return the members whose coordinate values intersect an interval.
+
+        Parameters
+        ----------
+        key : slice
+          Interval of coordinate values, bounds included. Missing bounds are unbounded.
+
+        Returns
+        -------
+        list
+          Path to the file of each member, sorted by coordinate values.
+        """
+        start = 0 if key.start is None else np.searchsorted(self.ends, key.start, side="left")
+        stop = len(self.starts) if key.stop is None else np.searchsorted(self.starts, key.stop, side="right")
+        return [self.locations[i] for i in self._order[start:stop]]
+
+    def __len__(self) -> int:
+        """Return number of members."""
+        return len(self.locations)
+
+    def __repr__(self) -> str:
+        """Return string representation."""
+        return f"{type(self).__name__}(<{len(self)} members>)"
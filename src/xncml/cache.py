@@ -0,0 +1,161 @@
+"""
+# Cache of parsed NcML documents
+
+Parsing an NcML document into the `generated` data model is costly compared to the rest of `open_ncml` when the same
+documents are opened over and over. `ParseCache` keeps the parsed models in memory, keyed by the resolved path of the
+document and invalidated whenever the file's modification time or size changes.
+
+Models are stored pickled: each hit returns a fresh copy, so callers can modify the object returned by `parse` without
+corrupting the cache, and the pickle length gives the approximate memory footprint used for the byte bound.
+"""
+
+from __future__ import annotations
+import os
+import pickle
+import sys
+import threading
+from collections import OrderedDict, namedtuple
+from pathlib import Path
+from typing import TYPE_CHECKING, Any
+
+
+if TYPE_CHECKING:
+    from collections.abc import Callable
+
+CacheInfo = namedtuple("CacheInfo", ["hits", "misses", "maxsize", "currsize", "maxbytes", "nbytes"])
+
+
+class ParseCache:
+    """
+    Thread-safe LRU cache of parsed NcML documents.
+
+    Parameters
+    ----------
+    maxsize : int
+      Maximum number of documents held in the cache. Set to 0 to disable caching.
+    maxbytes : int
+      Maximum approximate size, in bytes, of the documents held in the cache.
+    """
+
+    def __init__(self, maxsize: int = 256, maxbytes: int = 64 * 2**20):
+        self.maxsize = maxsize
+        self.maxbytes = maxbytes
+        self.hits = 0
+        self.misses = 0
+        self._nbytes = 0
+        # (resolved path, variant) -> (mtime_ns, size, pickled model)
+        self._entries: OrderedDict[tuple[str, str], tuple[int, int, bytes]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, path: str | Path, loader: Callable[[Path], Any], variant: str = "") -> Any:
+        """
+        Return the parsed model of the document at `path`, calling `loader` on a cache miss.
+
+        Parameters
+        ----------
+        path : str | Path
+          Path to NcML file.
+        loader : Callable
+          Function parsing the file at the given path.
+        variant : str
+          Name distinguishing models built differently from the same document.
+
+        Returns
+        -------
+        Any
+          A private copy of the parsed model.
+        """
+        path = Path(path).resolve()
+        key = (str(path), variant)
+        st = path.stat()
+        stamp = (st.st_mtime_ns, st.st_size)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[:2] == stamp:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                blob = entry[2]
+            else:
+                self.misses += 1
+                blob = None
+
+        if blob is not None:
+            return pickle.loads(blob)  # noqa: S301
+
+        obj = loader(path)
+        blob = pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            self._discard(key)
+            if 0 < self.maxsize and len(blob) <= self.maxbytes:
+                self._entries[key] = (*stamp, blob)
+                self._nbytes += len(blob)
+                self._evict()
+        return obj
+
+    def resize(self, maxsize: int | None = None, maxbytes: int | None = None):
+        """
+        Change the bounds of the cache, evicting the least recently used documents if needed.
+
+        Parameters
+        ----------
+        maxsize : int, optional
+          Maximum number of documents held in the cache.
+        maxbytes : int, optional
+          Maximum approximate size, in bytes, of the documents held in the cache.
+        """
+        with self._lock:
+            if maxsize is not None:
+                self.maxsize = maxsize
+            if maxbytes is not None:
+                self.maxbytes = maxbytes
+            self._evict()
+
+    def clear(self):
+        """Remove all documents from the cache and reset statistics."""
+        with self._lock:
+            self._entries.clear()
+            self._nbytes = 0
+            self.hits = 0
+            self.misses = 0
+
+    def cache_info(self) -> CacheInfo:
+        """Return cache statistics."""
+        with self._lock:
+            return CacheInfo(self.hits, self.misses, self.maxsize, len(self._entries), self.maxbytes, self._nbytes)
+
+    def __len__(self) -> int:
+        """Return the number of documents in the cache."""
+        return len(self._entries)
+
+    def _discard(self, key: tuple[str, str]):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._nbytes -= len(entry[2])
+
+    def _evict(self):
+        while self._entries and (len(self._entries) > self.maxsize or self._nbytes > self.maxbytes):
+            _, entry = self._entries.popitem(last=False)
+            self._nbytes -= len(entry[2])
+
+
+def user_cache_dir() -> Path:
+    """
+    Return the directory where persistent caches are stored.
+
+    The directory is given by the `XNCML_CACHE_DIR` environment variable, and defaults to the platform's user cache
+    directory.
+    """
+    if "XNCML_CACHE_DIR" in os.environ:
+        return Path(os.environ["XNCML_CACHE_DIR"])
+    if sys.platform == "win32":
+        base = Path(os.environ.get("LOCALAPPDATA", Path.home() / "AppData" / "Local"))
+    elif sys.platform == "darwin":
+        base = Path.home() / "Library" / "Caches"
+    else:
+        base = Path(os.environ.get("XDG_CACHE_HOME", Path.home() / ".cache"))
+    return base / "xncml"
+
+
+# Process-wide cache used by `parser.parse`.
+parse_cache = ParseCache()
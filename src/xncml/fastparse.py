@@ -0,0 +1,417 @@
+"""
+# Fast NcML reader
+
+Alternative to the `xsdata` `XmlParser` that fills the same `generated` data model from a streaming, C-accelerated
+`xml.etree.ElementTree.iterparse`. The mapping between XML names and dataclass fields is read once per class from the
+field metadata written by `xsdata generate`, so the model stays the single source of truth for the NcML schema.
+
+Elements are bound to dataclass instances as soon as they are closed, and then discarded from the XML tree, so the
+memory held by the parser is limited to the model being built. For very large aggregations, `parse(source, stream=True)`
+leaves the <netcdf> members out of the model: they are read from the document one at a time by a `MemberStream` when
+the aggregation is opened.
+"""
+
+from __future__ import annotations
+import io
+import sys
+import typing
+import warnings
+from contextlib import contextmanager
+from dataclasses import MISSING, dataclass, field, fields
+from enum import Enum
+from typing import TYPE_CHECKING, Any
+from xml.etree.ElementTree import iterparse
+
+
+if TYPE_CHECKING:
+    from collections.abc import Callable, Iterator
+    from pathlib import Path
+    from typing import IO
+
+
+@dataclass
+class _Binding:
+    """Description of how the XML attributes and children of an element map onto a dataclass."""
+
+    cls: type
+    # XML attribute name -> (field name, converter)
+    attributes: dict[str, tuple[str, Callable]] = field(default_factory=dict)
+    # Child element local name -> (field name, child class or None for text-only elements, is list)
+    elements: dict[str, tuple[str, type | None, bool]] = field(default_factory=dict)
+    # Name of the field holding mixed content, if any
+    mixed: str | None = None
+    # Default values of list fields, to be filled by children
+    lists: tuple[str, ...] = ()
+
+
+_BINDINGS: dict[type, _Binding] = {}
+
+
+def _local(tag: str) -> str:
+    """Return tag name stripped from its namespace."""
+    return tag.rpartition("}")[2]
+
+
+def _to_bool(value: str) -> bool:
+    value = value.strip()
+    if value in ("true", "1"):
+        return True
+    if value in ("false", "0"):
+        return False
+    raise ValueError(value)
+
+
+def _converter(typ: Any) -> Callable:
+    """Return function converting an XML attribute value to the given type annotation."""
+    args = [a for a in typing.get_args(typ) if a is not type(None)]
+    if args:
+        typ = args[0]
+    if typ is bool:
+        return _to_bool
+    if typ is int:
+        return lambda v: int(v.strip())
+    if typ is float:
+        return lambda v: float(v.strip())
+    if isinstance(typ, type) and issubclass(typ, Enum):
+        return typ
+    return str
+
+
+def _resolve(typ: Any, module: Any) -> type:
+    """Return class referred to by a choice type, e.g. `Type["EnumTypedef.EnumType"]`."""
+    (ref,) = typing.get_args(typ) or (typ,)
+    if isinstance(ref, typing.ForwardRef):
+        obj = module
+        for part in ref.__forward_arg__.split("."):
+            obj = getattr(obj, part)
+        return obj
+    return ref
+
+
+def _binding(cls: type) -> _Binding:
+    """Return binding of given class, computed from the `xsdata` field metadata."""
+    if (out := _BINDINGS.get(cls)) is not None:
+        return out
+
+    module = sys.modules[cls.__module__]
+    hints = typing.get_type_hints(cls, vars(module))
+    out = _Binding(cls)
+    lists = []
+    for f in fields(cls):
+        kind = f.metadata.get("type")
+        name = f.metadata.get("name", f.name)
+        typ = hints[f.name]
+        is_list = typing.get_origin(typ) is list
+        if f.default is MISSING and is_list:
+            lists.append(f.name)
+
+        if kind == "Attribute":
+            out.attributes[name] = (f.name, _converter(typ))
+        elif kind == "Element":
+            args = [a for a in typing.get_args(typ) if a is not type(None)]
+            child = args[0] if args else typ
+            out.elements[name] = (f.name, child if child is not object else None, is_list)
+        elif kind in ("Elements", "Wildcard"):
+            for choice in f.metadata.get("choices", ()):
+                out.elements[choice["name"]] = (f.name, _resolve(choice["type"], module), True)
+            if f.metadata.get("mixed"):
+                out.mixed = f.name
+    out.lists = tuple(lists)
+    _BINDINGS[cls] = out
+    return out
+
+
+def _convert(binding: _Binding, attrib: dict[str, str]) -> dict[str, Any]:
+    """Return dataclass keyword arguments from XML attributes."""
+    kwargs = {}
+    for key, value in attrib.items():
+        if (spec := binding.attributes.get(_local(key))) is None:
+            continue
+        name, conv = spec
+        try:
+            kwargs[name] = conv(value)
+        except ValueError:
+            warnings.warn(f"Failed to convert value `{value}` for `{binding.cls.__name__}.{name}`", stacklevel=4)
+            kwargs[name] = value
+    return kwargs
+
+
+def _any_element(elem) -> Any:
+    """Return generic object for element not described by the schema."""
+    from xsdata.formats.dataclass.models.generics import AnyElement
+
+    return AnyElement(
+        qname=elem.tag,
+        text=elem.text or "",
+        tail=elem.tail,
+        children=[_any_element(child) for child in elem],
+        attributes=dict(elem.attrib),
+    )
+
+
+class _Binder:
+    """
+    Build a dataclass instance from the start and end events of an XML element and its descendants.
+
+    Parameters
+    ----------
+    root : type
+      Dataclass describing the first element fed to the binder.
+    """
+
+    def __init__(self, root: type):
+        self.root = root
+        # Stack of (element, binding, keyword arguments, [(child element, child object, bound), ...] for mixed content).
+        self.stack: list[tuple[Any, _Binding | None, dict | None, list | None]] = []
+
+    def start(self, elem):
+        """Handle opening of XML element."""
+        if not self.stack:
+            binding = _binding(self.root)
+        else:
+            parent = self.stack[-1][1]
+            spec = None if parent is None else parent.elements.get(_local(elem.tag))
+            if spec is None:
+                if parent is not None and parent.mixed is None:
+                    raise ValueError(f"Unknown property {parent.cls.__name__}:{elem.tag}")
+                # Element not described by the schema, bound as a whole when closed.
+                self.stack.append((elem, None, None, None))
+                return
+            binding = _binding(spec[1]) if spec[1] is not None else None
+        kwargs = {} if binding is None else {name: [] for name in binding.lists}
+        self.stack.append((elem, binding, kwargs, [] if binding is not None and binding.mixed else None))
+
+    def end(self, elem) -> Any:
+        """Handle closing of XML element, returning the bound object once the first element is closed."""
+        elem, binding, kwargs, children = self.stack.pop()
+        if binding is None:
+            if kwargs is None:
+                obj = None if self.stack and self.stack[-1][1] is None else _any_element(elem)
+            else:
+                # Untyped element, e.g. <readMetadata/>. Its value is its text.
+                obj = elem.text or ""
+        else:
+            obj = self._build(elem, binding, kwargs, children)
+
+        if not self.stack:
+            return obj
+
+        parent_elem, parent, parent_kwargs, parent_children = self.stack[-1]
+        if parent is None:
+            return _PENDING
+        spec = parent.elements.get(_local(elem.tag))
+        if parent_children is not None and (spec is None or spec[0] == parent.mixed):
+            # Mixed content is assembled when the parent is closed, to preserve text and element order.
+            parent_children.append((elem, obj, spec is not None))
+            return _PENDING
+        self.assign(parent, parent_kwargs, spec, obj)
+        if parent_children is None:
+            # Release the closed element, it is always the last child of its parent.
+            del parent_elem[-1]
+        return _PENDING
+
+    def assign(self, parent: _Binding, kwargs: dict, spec: tuple[str, type | None, bool], obj: Any):
+        """Store child object in the keyword arguments of its parent."""
+        name, _, is_list = spec
+        if is_list:
+            kwargs[name].append(obj)
+        else:
+            kwargs[name] = obj
+
+    @staticmethod
+    def _build(elem, binding: _Binding, kwargs: dict, children: list | None) -> Any:
+        kwargs.update(_convert(binding, elem.attrib))
+        if binding.mixed is not None:
+            content = kwargs[binding.mixed]
+            if elem.text and elem.text.strip():
+                content.append(elem.text)
+            for child, child_obj, bound in children:
+                content.append(child_obj)
+                if not bound:
+                    child_obj.tail = child.tail
+                elif child.tail and child.tail.strip():
+                    content.append(child.tail)
+        return binding.cls(**kwargs)
+
+
+# Marker returned by `_Binder.end` while the first element is still open.
+_PENDING = object()
+
+
+def iterbind(source: str | Path | IO, root: type) -> Any:
+    """
+    Parse XML document into an instance of `root`.
+
+    Parameters
+    ----------
+    source : str | Path | IO
+      Path or binary file object to the XML document.
+    root : type
+      Dataclass from the `generated` model describing the root element.
+
+    Returns
+    -------
+    Any
+      Instance of `root`.
+    """
+    binder = _Binder(root)
+    with _open(source) as f:
+        for event, elem in iterparse(f, events=("start", "end")):  # noqa: S314
+            if event == "start":
+                binder.start(elem)
+            elif (obj := binder.end(elem)) is not _PENDING:
+                return obj
+    raise ValueError("Incomplete XML document.")
+
+
+class MemberStream:
+    """
+    Iterable over the <netcdf> members of an aggregation, read from the NcML document each time it is iterated.
+
+    Parameters
+    ----------
+    source : str | Path | bytes
+      Path to the NcML document, or its content.
+    index : int
+      Position of the <aggregation> element among the aggregations of the root <netcdf> element.
+    """
+
+    def __init__(self, source: str | Path | bytes, index: int = 0):
+        self.source = source
+        self.index = index
+
+    def __iter__(self) -> Iterator[Any]:
+        """Iterate over members, binding them one at a time."""
+        return iter_members(self.source, self.index)
+
+    def __repr__(self) -> str:
+        """Return a short description of the stream."""
+        source = "<bytes>" if isinstance(self.source, bytes) else str(self.source)
+        return f"MemberStream({source!r}, index={self.index})"
+
+    def __eq__(self, other: object) -> bool:
+        """Return whether both streams read the same members."""
+        if isinstance(other, MemberStream):
+            return (self.source, self.index) == (other.source, other.index)
+        return NotImplemented
+
+
+def iter_members(source: str | Path | bytes, index: int = 0) -> Iterator[Any]:
+    """
+    Yield <netcdf> members of an aggregation as they are read from the NcML document.
+
+    Only one member is held in memory at any time, so memory usage does not depend on the number of members.
+
+    Parameters
+    ----------
+    source : str | Path | bytes
+      Path to the NcML document, or its content.
+    index : int
+      Position of the <aggregation> element among the aggregations of the root <netcdf> element.
+
+    Yields
+    ------
+    Netcdf instance.
+      Object description of the member.
+    """
+    from .generated import Netcdf
+
+    binder = None
+    depth = 0
+    seen = -1
+    agg = None
+    with _open(source) as f:
+        for event, elem in iterparse(f, events=("start", "end")):  # noqa: S314
+            if binder is not None:
+                if event == "start":
+                    binder.start(elem)
+                elif (obj := binder.end(elem)) is not _PENDING:
+                    binder = None
+                    depth -= 1
+                    del agg[-1]
+                    yield obj
+                continue
+
+            if event == "start":
+                depth += 1
+                if depth == 2 and _local(elem.tag) == "aggregation":
+                    seen += 1
+                    agg = elem if seen == index else None
+                elif depth == 3 and agg is not None and _local(elem.tag) == "netcdf":
+                    binder = _Binder(Netcdf)
+                    binder.start(elem)
+            else:
+                depth -= 1
+                if depth == 1 and agg is not None:
+                    return
+
+
+def _parse_header(source: str | Path | bytes) -> Any:
+    """Parse NcML document, replacing the members of aggregations by a `MemberStream`."""
+    from .generated import Aggregation, Netcdf
+
+    binder = _Binder(Netcdf)
+    skip = 0
+    obj = _PENDING
+    with _open(source) as f:
+        for event, elem in iterparse(f, events=("start", "end")):  # noqa: S314
+            if skip:
+                # Inside a member of the aggregation: not bound, and released once closed.
+                skip += 1 if event == "start" else -1
+                if skip == 0:
+                    del binder.stack[-1][0][-1]
+                continue
+
+            if event == "start":
+                parent = binder.stack[-1][1] if len(binder.stack) == 2 else None
+                if parent is not None and parent.cls is Aggregation and _local(elem.tag) == "netcdf":
+                    skip = 1
+                else:
+                    binder.start(elem)
+            elif (obj := binder.end(elem)) is not _PENDING:
+                break
+    if obj is _PENDING:
+        raise ValueError("Incomplete XML document.")
+
+    for i, agg in enumerate(item for item in obj.choice if isinstance(item, Aggregation)):
+        agg.netcdf = MemberStream(source, i)
+    return obj
+
+
+@contextmanager
+def _open(source: str | Path | bytes | IO) -> Iterator[IO]:
+    """Return file object readable by `iterparse`, closing it on exit if it was opened here."""
+    if isinstance(source, bytes):
+        yield io.BytesIO(source)
+    elif hasattr(source, "read"):
+        yield source
+    else:
+        # Opened here rather than by `iterparse`, which only closes files it has read to the end.
+        with open(source, "rb") as f:
+            yield f
+
+
+def parse(source: str | Path | bytes | IO, stream: bool = False) -> Any:
+    """
+    Parse NcML document using the fast reader.
+
+    Parameters
+    ----------
+    source : str | Path | bytes | IO
+      Path to the NcML document, its content, or binary file object from which it is read.
+    stream : bool
+      If True, the <netcdf> members of the aggregations are not read. They are replaced by a `MemberStream` that reads
+      them from the document one at a time when iterated. `source` must then be a path or bytes.
+
+    Returns
+    -------
+    Netcdf instance.
+      Object description of NcML content.
+    """
+    from .generated import Netcdf
+
+    if stream:
+        if hasattr(source, "read"):
+            raise ValueError("Streaming aggregation members requires a path to the NcML document or its content.")
+        return _parse_header(source)
+    return iterbind(source, Netcdf)
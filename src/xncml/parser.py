@@ -25,22 +25,27 @@ Support for these elements is missing:
 - <scanFmrc>
 
 Support for these attributes is missing:
-- dateFormatMark
-- olderThan
 - tiled aggregations
 """
 
 from __future__ import annotations
+import dataclasses
 import datetime as dt
+import pickle
+import threading
+import time
+from concurrent.futures import Executor, ThreadPoolExecutor
+from contextlib import contextmanager
 from functools import partial
+from itertools import islice
 from pathlib import Path
-from typing import TYPE_CHECKING
-from warnings import warn
+from typing import TYPE_CHECKING, Any
+from warnings import catch_warnings, simplefilter, warn
 
 import numpy as np
 import xarray as xr
-from xsdata.formats.dataclass.parsers import XmlParser
 
+from .cache import parse_cache
 from .generated import (
     Aggregation,
     AggregationType,
@@ -58,7 +63,11 @@ from .generated import (
 
 
 if TYPE_CHECKING:
-    from collections.abc import Iterator
+    from collections.abc import Callable, Iterable, Iterator
+    from typing import IO
+
+    from .aggregation import Manifest, Member, MemberIndex
+    from .plan import Plan
 
 __author__ = "David Huard, Abel Aoun"
 __date__ = "July 2022"
@@ -66,52 +75,347 @@ __contact__ = "huard.david@ouranos.ca"
 
 FLATTEN_GROUPS = "*"
 ROOT_GROUP = "/"
+PARSE_ENGINES = ("xsdata", "fast", "stream")
+# Placeholder file name of NcML documents that are not read from a path.
+IN_MEMORY = "<in-memory>"
 
 
-def parse(path: Path) -> Netcdf:
+def parse(source: str | Path | bytes | IO | Netcdf, cache: bool = True, engine: str = "xsdata") -> Netcdf:
     """
     Parse NcML file using NetCDF datamodel based on NcML-2.2 Schema.
 
     Parameters
     ----------
-    path : Path
-      Path to NcML file.
+    source : str | Path | bytes | IO | Netcdf
+      Path to NcML file, NcML document as a string or bytes, or file-like object from which the document is read.
+      A `Netcdf` instance is returned as is.
+    cache : bool
+      If True, reuse the model held in the process-wide `cache.parse_cache` if the file has not changed since it was
+      last parsed. Only documents read from a path are cached.
+    engine : {"xsdata", "fast", "stream"}
+      Parser used to read the XML document. "xsdata" uses the `xsdata` XmlParser, while "fast" uses the streaming
+      reader from `xncml.fastparse`. Both return the same object. "stream" uses the fast reader but does not load the
+      <netcdf> members of aggregations, which are read from the document one at a time when the aggregation is
+      iterated, keeping memory usage independent of the number of members.
 
     Returns
     -------
     Netcdf instance.
       Object description of NcML content.
     """
-    parser = XmlParser()
-    return parser.from_path(path, Netcdf)
+    if isinstance(source, Netcdf):
+        return source
+    if engine not in PARSE_ENGINES:
+        raise ValueError(f"Unknown parsing engine {engine!r}, expected one of {list(PARSE_ENGINES)}.")
+
+    content = _xml_content(source)
+    if content is not None:
+        return _parse_source(content, engine=engine)
+    if cache:
+        return parse_cache.get(source, partial(_parse_source, engine=engine), variant="stream" if engine == "stream" else "")
+    return _parse_source(Path(source), engine=engine)
+
+
+def _xml_content(source: str | Path | bytes | IO) -> bytes | None:
+    """Return NcML document held in memory or read from file-like object, or None if `source` is a path."""
+    if hasattr(source, "read"):
+        # Data read from a file-like object is the document, whatever it starts with.
+        source = source.read()
+        return source.encode() if isinstance(source, str) else bytes(source)
+    if isinstance(source, bytes | bytearray | memoryview):
+        return bytes(source)
+    if isinstance(source, str) and source.lstrip().startswith("<"):
+        return source.encode()
+    return None
+
+
+def _parse_source(source: Path | bytes, engine: str = "xsdata") -> Netcdf:
+    if engine in ("fast", "stream"):
+        from . import fastparse
 
+        return fastparse.parse(source, stream=engine == "stream")
 
-def open_ncml(ncml: str | Path, group: str = ROOT_GROUP) -> xr.Dataset:
+    from xsdata.formats.dataclass.parsers import XmlParser
+
+    parser = XmlParser()
+    if isinstance(source, bytes):
+        return parser.from_bytes(source, Netcdf)
+    return parser.from_path(source, Netcdf)
+
+
+def open_ncml(
+    ncml: str | Path | bytes | IO | Netcdf,
+    group: str = ROOT_GROUP,
+    parse_engine: str = "xsdata",
+    base_path: str | Path | None = None,
+    parallel: int | Executor | None = None,
+    lazy_members: bool = False,
+    manifest: bool | str | Path = False,
+    chunks: int | dict | str | None = None,
+    isel: dict | None = None,
+    sel: dict | None = None,
+    compat: str | None = None,
+) -> xr.Dataset:
     """
     Convert NcML document to a dataset.
 
     Parameters
     ----------
-    ncml : str | Path
-      Path to NcML file.
+    ncml : str | Path | bytes | IO | Netcdf
+      Path to NcML file, NcML document as a string or bytes, file-like object from which the document is read, or
+      document already parsed with `parse`.
     group : str
       Path of the group to parse within the ncml.
       The special value ``*`` opens every group and flattens the variables into a single
       dataset, renaming variables and dimensions if conflicting names are found.
+    parse_engine : {"xsdata", "fast", "stream"}
+      Parser used to read the NcML document, see `parse`.
+    base_path : str | Path, optional
+      Directory against which relative `location` attributes are resolved. Defaults to the directory of the NcML file,
+      or to the current working directory for documents that are not read from a path.
+    parallel : int | Executor, optional
+      Number of threads used to open the members of aggregations concurrently, or executor to which the opening of
+      each member is submitted. Members are opened one after the other by default. Since netCDF4 and HDF5 are not
+      thread-safe, the metadata of netCDF4 files is read under the lock of xarray, while the decoding of variables and
+      the rest of the reading of members run concurrently. The order of members is preserved, and if any member fails
+      to open, files already opened are closed before the error is raised.
+    lazy_members : bool
+      If True, the members of joinExisting aggregations that merely point to a file are not opened. Only the length of
+      the aggregation dimension and the values of its coordinate are read from each file, the first member serving as
+      a template for the other variables, and the data of members is read when it is computed. Members are assumed to
+      share the same variables and metadata.
+    manifest : bool | str | Path
+      If True, or given the directory where manifests are stored, the layout of members probed with `lazy_members` is
+      recorded in a manifest kept on disk, identified by the hash of the NcML document. Files whose modification time
+      and size are unchanged since they were recorded are not probed again. Manifests are stored by default in the user
+      cache directory, see `cache.user_cache_dir`.
+    chunks : int | dict | {"auto", "file-aligned"}, optional
+      Chunk sizes of the dask arrays holding the data of all files read, passed to `xr.open_dataset` so that no
+      rechunking is needed once files are opened. "file-aligned" makes one chunk per variable and file. A dictionary maps
+      dimension names to chunk sizes, with dimensions left out spanning the whole file. By default, the files found by
+      <scan> elements are read as one chunk per variable and file, and other files are not read with dask.
+    isel : dict, optional
+      Positions to select along dimensions, as given to `xr.Dataset.isel`.
+    sel : dict, optional
+      Labels to select along dimensions, as given to `xr.Dataset.sel`, once `isel` is applied. Along the dimension of
+      a joinExisting aggregation, only the members overlapping the selection are concatenated. With `lazy_members`,
+      members are thus selected from their layout alone, without opening them.
+    compat : {"override"}, optional
+      If "override", members of joinExisting and joinNew aggregations are trusted to share the variables that are not
+      aggregated, and their coordinates along other dimensions. Only the variables along the aggregation dimension, or
+      selected by <variableAgg>, are concatenated, other variables are taken from the first member without being
+      compared to those of the others, and indexes are not aligned. By default, members are concatenated with the
+      defaults of `xr.concat`.
 
     Returns
     -------
     xr.Dataset
-      Dataset holding variables and attributes defined in NcML document.
+      Dataset holding variables and attributes defined in NcML document. If it is a joinExisting aggregation, its
+      `encoding["member_index"]` is the `aggregation.MemberIndex` of its members, telling which file holds a given
+      coordinate value.
+    """
+    if manifest and not lazy_members:
+        raise ValueError("`manifest` requires `lazy_members=True`.")
+    _check_compat(compat)
+
+    obj, ncml, manifest = _prepare(ncml, parse_engine, base_path, manifest)
+    # Selections along aggregation dimensions are removed from these as they are applied while reading aggregations.
+    isel, sel = dict(isel or {}), dict(sel or {})
+    with _executor(parallel) as executor:
+        ds = read_netcdf(
+            xr.Dataset(),
+            xr.Dataset(),
+            obj,
+            ncml,
+            group,
+            parallel=executor,
+            lazy_members=lazy_members,
+            manifest=manifest,
+            chunks=_file_chunks(chunks),
+            isel=isel,
+            sel=sel,
+            compat=compat,
+        )
+    return ds.isel(isel).sel(sel) if isel or sel else ds
+
+
+class AggregatedDataset:
     """
+    Long-lived handle on the dataset defined by an NcML document, refreshed as files are added to its aggregations.
+
+    The NcML document is parsed once, and the members of joinExisting aggregations are read lazily, see `open_ncml`.
+    Once the `recheckEvery` interval of the document's aggregations has passed, `refresh` scans for new files. Files
+    sorted after those already aggregated are probed and appended to the previous concatenation, so that the cost of a
+    refresh grows with the number of new files rather than with the size of the aggregation. If files were removed, or
+    inserted among the previous ones, the aggregation is read anew.
+
+    Parameters
+    ----------
+    ncml : str | Path | bytes | IO | Netcdf
+      NcML document, see `open_ncml`.
+    group : str
+      Path of the group to parse within the ncml.
+    parse_engine : {"xsdata", "fast", "stream"}
+      Parser used to read the NcML document, see `parse`.
+    base_path : str | Path, optional
+      Directory against which relative `location` attributes are resolved.
+    parallel : int | Executor, optional
+      Number of threads, or executor, used to scan and open the members of aggregations concurrently.
+    manifest : bool | str | Path
+      Whether to record the layout of members in a manifest on disk, see `open_ncml`.
+    chunks : int | dict | {"auto", "file-aligned"}, optional
+      Chunk sizes of the dask arrays holding the data of files, see `open_ncml`.
+    compat : {"override"}, optional
+      Whether to trust members to share the variables that are not aggregated, see `open_ncml`.
+
+    Attributes
+    ----------
+    dataset : xr.Dataset
+      Dataset holding variables and attributes defined in NcML document, as of the last refresh.
+    last_checked : float
+      Time of the last check for new files, as given by `time.monotonic`.
+    """
+
+    def __init__(
+        self,
+        ncml: str | Path | bytes | IO | Netcdf,
+        group: str = ROOT_GROUP,
+        parse_engine: str = "xsdata",
+        base_path: str | Path | None = None,
+        parallel: int | Executor | None = None,
+        manifest: bool | str | Path = False,
+        chunks: int | dict | str | None = None,
+        compat: str | None = None,
+    ):
+        _check_compat(compat)
+        self._obj, self._ncml, self._manifest = _prepare(ncml, parse_engine, base_path, manifest)
+        self._group = group
+        self._parallel = parallel
+        self._chunks = _file_chunks(chunks)
+        self._compat = compat
+        # State of the aggregations read lazily, by id of <aggregation> object.
+        self._state: dict[int, _LazyAggregation] = {}
+        self.dataset = self._read()
+        self.last_checked = time.monotonic()
+
+    @property
+    def recheck_every(self) -> dt.timedelta | None:
+        """Shortest `recheckEvery` interval of the document's aggregations, or None if none is set."""
+        from .scan import parse_duration
+
+        intervals = [parse_duration(agg.recheck_every) for agg in filter_by_class(self._obj.choice, Aggregation) if agg.recheck_every]
+        return min(intervals, default=None)
+
+    def refresh(self, force: bool = False) -> bool:
+        """
+        Update dataset with the files added to or removed from aggregations since the last check.
+
+        Parameters
+        ----------
+        force : bool
+          If True, check for new files even if the `recheckEvery` interval has not passed, or is not set.
+
+        Returns
+        -------
+        bool
+          Whether aggregations were checked, in which case `dataset` is replaced.
+        """
+        interval = self.recheck_every
+        if not force and (interval is None or time.monotonic() - self.last_checked < interval.total_seconds()):
+            return False
+
+        previous = dict(self._state)
+        dataset = self._read()
+        self.last_checked = time.monotonic()
+
+        # Close files that are no longer used by the new dataset.
+        self.dataset.close()
+        for key, entry in previous.items():
+            if self._state.get(key) is not entry:
+                _multi_file_closer(entry.closers)
+        self.dataset = dataset
+        return True
+
+    def close(self):
+        """Close dataset and all files opened by aggregations."""
+        self.dataset.close()
+        for entry in self._state.values():
+            _multi_file_closer(entry.closers)
+        self._state.clear()
+
+    def __enter__(self) -> AggregatedDataset:
+        """Enter context, closing files on exit."""
+        return self
+
+    def __exit__(self, *args):
+        """Close files."""
+        self.close()
+
+    def _read(self) -> xr.Dataset:
+        with _executor(self._parallel) as executor:
+            return read_netcdf(
+                xr.Dataset(),
+                xr.Dataset(),
+                self._obj,
+                self._ncml,
+                self._group,
+                parallel=executor,
+                lazy_members=True,
+                manifest=self._manifest,
+                state=self._state,
+                chunks=self._chunks,
+                compat=self._compat,
+            )
+
+
+def _prepare(
+    ncml: str | Path | bytes | IO | Netcdf, parse_engine: str, base_path: str | Path | None, manifest: bool | str | Path
+) -> tuple[Netcdf, Path, Manifest | None]:
+    """Return parsed NcML document, path against which relative links are resolved, and aggregation manifest."""
     # Parse NcML document
-    ncml = Path(ncml)
-    obj = parse(ncml)
+    if isinstance(ncml, Netcdf):
+        obj, path = ncml, None
+        content = pickle.dumps(ncml) if manifest else None
+    elif (content := _xml_content(ncml)) is not None:
+        obj, path = parse(content, engine=parse_engine), None
+    else:
+        path = Path(ncml)
+        obj = parse(path, engine=parse_engine)
+        content = path.read_bytes() if manifest else None
 
-    return read_netcdf(xr.Dataset(), xr.Dataset(), obj, ncml, group)
+    if manifest:
+        from .aggregation import Manifest
 
+        manifest = Manifest.for_document(content, cache_dir=None if manifest is True else manifest)
+    else:
+        manifest = None
+
+    # Relative links are resolved against the parent of `ncml`.
+    if base_path is not None:
+        ncml = Path(base_path) / IN_MEMORY
+    elif path is None:
+        ncml = Path.cwd() / IN_MEMORY
+    else:
+        ncml = path
+    return obj, ncml, manifest
 
-def read_netcdf(target: xr.Dataset, ref: xr.Dataset, obj: Netcdf, ncml: Path, group: str) -> xr.Dataset:
+
+def read_netcdf(
+    target: xr.Dataset,
+    ref: xr.Dataset,
+    obj: Netcdf,
+    ncml: Path,
+    group: str,
+    parallel: int | Executor | None = None,
+    lazy_members: bool = False,
+    manifest: Manifest | None = None,
+    state: dict | None = None,
+    chunks: int | dict | str | None = None,
+    drop_variables: Iterable[str] = (),
+    isel: dict | None = None,
+    sel: dict | None = None,
+    compat: str | None = None,
+) -> xr.Dataset:
     """
     Return content of <netcdf> element.
 
@@ -129,14 +433,34 @@ def read_netcdf(target: xr.Dataset, ref: xr.Dataset, obj: Netcdf, ncml: Path, gr
       Path of the group to parse within the ncml.
       The special value ``*`` opens every group and flattens the variables into a single
       dataset.
+    parallel : int | Executor, optional
+      Number of threads, or executor, used to open the members of aggregations concurrently.
+    lazy_members : bool
+      If True, the variables of joinExisting aggregation members are read lazily, see `open_ncml`.
+    manifest : Manifest, optional
+      Record of the layout of aggregation members, used with `lazy_members`.
+    state : dict, optional
+      State of aggregations read lazily, updated in place and reused to append new members, see `AggregatedDataset`.
+    chunks : int | dict | str, optional
+      Chunk sizes of the dask arrays holding the data of files, passed to `xr.open_dataset`.
+    drop_variables : Iterable of str
+      Variables that need not be read from files, in addition to those removed by <remove> elements.
+    isel, sel : dict, optional
+      Selections to be applied to the dataset, see `read_aggregation`. Selections along the dimension of an
+      aggregation are applied to it, and removed from the dictionaries, if the rest of the document does not depend on
+      the whole length of that dimension.
+    compat : {"override"}, optional
+      Whether to trust aggregation members to share the variables that are not aggregated, see `read_aggregation`.
 
     Returns
     -------
     xr.Dataset
       Dataset holding variables and attributes defined in <netcdf> element.
     """
+    drop_variables = _dropped_variables(obj, drop_variables)
+
     # Open location if any
-    ref = read_ds(obj, ncml) or ref
+    ref = read_ds(obj, ncml, chunks=chunks, drop_variables=drop_variables) or ref
 
     # <explicit/> element means that only content specifically mentioned in NcML document is included in dataset.
     if obj.explicit is not None:
@@ -145,18 +469,49 @@ def read_netcdf(target: xr.Dataset, ref: xr.Dataset, obj: Netcdf, ncml: Path, gr
         # By default, all metadata from the reference dataset is read: <readMetadata/>
         target = ref
 
-    for item in filter_by_class(obj.choice, Aggregation):
-        target = read_aggregation(target, item, ncml)
+    aggregations = list(filter_by_class(obj.choice, Aggregation))
+    for item in aggregations:
+        # Selections are only applied to an aggregation that is the sole content of the dataset along its dimension.
+        pushdown = len(aggregations) == 1 and not obj.location and group == ROOT_GROUP and not _depends_on_dim(obj, item.dim_name)
+        target = read_aggregation(
+            target,
+            item,
+            ncml,
+            parallel=parallel,
+            lazy_members=lazy_members,
+            manifest=manifest,
+            state=state,
+            chunks=chunks,
+            drop_variables=drop_variables,
+            isel=isel if pushdown else None,
+            sel=sel if pushdown else None,
+            compat=compat,
+        )
+    # Variables removed by <remove> elements may have been left out of the files already.
+    dropped = _dropped_from(ref, target)
     if group == FLATTEN_GROUPS:
-        target = _flatten_groups(target, ref, obj)
+        target = _flatten_groups(target, ref, obj, dropped=dropped)
     else:
         if not group.startswith("/"):
             group = f"/{group}"
-        target = read_group(target, ref, obj, groups_to_read=[group])
+        target = read_group(target, ref, obj, groups_to_read=[group], dropped=dropped)
     return target
 
 
-def read_aggregation(target: xr.Dataset, obj: Aggregation, ncml: Path) -> xr.Dataset:
+def read_aggregation(
+    target: xr.Dataset,
+    obj: Aggregation,
+    ncml: Path,
+    parallel: int | Executor | None = None,
+    lazy_members: bool = False,
+    manifest: Manifest | None = None,
+    state: dict | None = None,
+    chunks: int | dict | str | None = None,
+    drop_variables: Iterable[str] = (),
+    isel: dict | None = None,
+    sel: dict | None = None,
+    compat: str | None = None,
+) -> xr.Dataset:
     """
     Return merged or concatenated content of <aggregation> element.
 
@@ -168,16 +523,46 @@ def read_aggregation(target: xr.Dataset, obj: Aggregation, ncml: Path) -> xr.Dat
        <aggregation> object description.
     ncml : Path
       Path to NcML document, sometimes required to follow relative links.
+    parallel : int | Executor, optional
+      Number of threads, or executor, used to open the aggregation members concurrently.
+    lazy_members : bool
+      If True and the aggregation is joinExisting, members are probed for their layout along the aggregation dimension
+      instead of being opened, and their variables are read lazily.
+    manifest : Manifest, optional
+      Record of the layout of aggregation members, reused for files that did not change since they were probed.
+    state : dict, optional
+      State of aggregations read lazily. If it holds the state of a previous read of this aggregation, and the files
+      found by <scan> elements then are still found first, in the same order, new files are appended to the previous
+      concatenation. Otherwise, the aggregation is read anew and its state stored. Files held open by the aggregation
+      are then closed with the state rather than with the returned dataset.
+    chunks : int | dict | str, optional
+      Chunk sizes of the dask arrays holding the data of members, passed to `xr.open_dataset`. By default, the files
+      found by <scan> elements are read as one chunk per variable and file.
+    drop_variables : Iterable of str
+      Variables that need not be read from members, in addition to those removed by <remove> elements. If variables
+      are selected by <variableAgg> elements, the other variables of the first member opened are not read from the
+      others.
+    isel, sel : dict, optional
+      Positions and labels to select, as given to `xr.Dataset.isel` and `xr.Dataset.sel`. If the aggregation is
+      joinExisting, the selection along its dimension is applied to the concatenation of the members overlapping it,
+      and removed from the dictionary. Labels are matched against the coordinates of members, which must all be
+      known.
+    compat : {"override"}, optional
+      If "override", only the variables along the aggregation dimension, or selected by <variableAgg>, are
+      concatenated, other variables are taken from the first member, and indexes are not aligned.
 
     Returns
     -------
     xr.Dataset
-      Dataset holding variables and attributes defined in <aggregation> element.
+      Dataset holding variables and attributes defined in <aggregation> element. The `aggregation.MemberIndex` of the
+      members of joinExisting aggregations is stored in `encoding["member_index"]`, if their coordinates are known.
     """
-    from xarray.coding.times import CFDatetimeCoder
-
     # Names of variables to be aggregated. All variables if undefined.
-    names = [v.name for v in filter_by_class(obj.choice, Aggregation.VariableAgg)]
+    names = [v.name for v in obj.variable_agg]
+
+    # Variables that are not read from members. The aggregation coordinate is always read.
+    drop = [name for name in _dropped_variables(obj, drop_variables) if name != obj.dim_name]
+    unselected = select = partial(_unselected_variables, names=names, dim_name=obj.dim_name) if names else None
 
     for attr in obj.promote_global_attribute:
         msg = f"{attr} in <promoteGlobalAttribute> not implemented yet."
@@ -187,52 +572,174 @@ def read_aggregation(target: xr.Dataset, obj: Aggregation, ncml: Path) -> xr.Dat
     datasets = []
     closers = []
 
-    for item in obj.netcdf:
-        # Open dataset defined in <netcdf>'s `location` attribute
-        tar = read_netcdf(xr.Dataset(), ref=xr.Dataset(), obj=item, ncml=ncml, group=ROOT_GROUP)
-        closers.append(tar._close)
-
-        # Select variables
-        if names:
-            tar = tar[names]
-
-        # Handle coordinate values
-        if item.coord_value is not None:
-            dtypes = [i[obj.dim_name].dtype.type for i in [tar, target] if obj.dim_name in i]
-            coords = read_coord_value(item, obj, dtypes=dtypes)
-            tar = tar.assign_coords({obj.dim_name: coords})
-        datasets.append(tar)
-
-    # Handle <scan> element
-    for item in obj.scan:
-        dss = read_scan(item, ncml)
-        datasets.extend([ds.chunk() for ds in dss])
-        closers.extend([ds._close for ds in dss])
+    read_member = partial(_read_member, ncml=ncml, lazy_members=lazy_members, manifest=manifest, state=state, chunks=chunks, compat=compat)
+    lazy = lazy_members and obj.type == AggregationType.JOIN_EXISTING
+    previous = state.get(id(obj)) if lazy and state is not None else None
+
+    with _executor(parallel) as executor:
+        if previous is not None:
+            agg = _append_members(obj, ncml, previous, executor, manifest=manifest, chunks=chunks, compat=compat)
+            if agg is not None:
+                return _merge_aggregation(target, agg, obj, closers=[], dropped=_dropped_from(agg))
+
+        if lazy:
+            members, scanned, current = _read_members_lazily(
+                obj, ncml, read_member, executor, manifest=manifest, chunks=chunks, drop_variables=drop, select=select
+            )
+            closers = current.closers
+        else:
+            members, drop = _open_projected(read_member, obj.netcdf, executor, drop, select, key=_MemberRef.of)
+            closers.extend(tar._close for _, tar in members)
+            if members:
+                select = None
 
-    # Need to decode time variable
-    if obj.time_units_change:
-        for i, ds in enumerate(datasets):
-            t = xr.as_variable(ds[obj.dim_name], obj.dim_name)  # Maybe not the same name...
-            encoded = CFDatetimeCoder(use_cftime=True).decode(t, name=t.name)
-            datasets[i] = ds.assign_coords({obj.dim_name: encoded})
+        try:
+            for ref, tar in members:
+                # Select variables
+                if names:
+                    tar = tar.drop_vars(unselected(tar))
+
+                # Handle coordinate values
+                if ref.coord_value is not None:
+                    dtypes = [i[obj.dim_name].dtype.type for i in [tar, target] if obj.dim_name in i]
+                    coords = read_coord_value(ref, obj, dtypes=dtypes)
+                    tar = tar.assign_coords({obj.dim_name: coords})
+                datasets.append(tar)
+
+            # Handle <scan> element
+            if lazy:
+                datasets.extend(scanned)
+            else:
+                for item in obj.scan:
+                    dss = read_scan(item, ncml, parallel=executor, chunks=chunks, drop_variables=drop, select=select)
+                    closers.extend([ds._close for ds in dss])
+                    if names:
+                        dss = [ds.drop_vars(unselected(ds)) for ds in dss]
+                    if item.date_format_mark:
+                        dss = read_scan_dates(dss, [ds.encoding["source"] for ds in dss], item, obj)
+                    datasets.extend(dss if chunks is not None else [ds.chunk() for ds in dss])
+        except BaseException:
+            _multi_file_closer(closers)
+            raise
+
+    # Need to decode time variable, which is assigned to the concatenation of members.
+    times = _decode_time(datasets, obj.dim_name) if obj.time_units_change and obj.type != AggregationType.UNION else None
+
+    # Only the members overlapping the selection along the aggregation dimension are concatenated.
+    indexer = None
+    if obj.type == AggregationType.JOIN_EXISTING and not _depends_on_dim(obj, obj.dim_name):
+        isel, sel = isel or {}, sel or {}
+        if (obj.dim_name in isel or obj.dim_name in sel) and (
+            selected := _select_members(
+                datasets, obj.dim_name, isel.get(obj.dim_name), sel.get(obj.dim_name), coords=None if times is None else times.values
+            )
+        ):
+            keep, indexer = selected
+            if times is not None:
+                offsets = np.cumsum([0] + [ds.sizes[obj.dim_name] for ds in datasets])
+                times = times[np.concatenate([np.arange(offsets[i], offsets[i + 1]) for i in keep])]
+            datasets = [datasets[i] for i in keep]
+            isel.pop(obj.dim_name, None)
+            sel.pop(obj.dim_name, None)
+
+    dropped = _dropped_from(*datasets)
 
     # Translate different types of aggregation into xarray instructions.
     if obj.type == AggregationType.JOIN_EXISTING:
-        agg = xr.concat(datasets, obj.dim_name)
+        from .aggregation import MemberIndex
+
+        agg = _concat(datasets, obj, names, compat)
+        if times is not None:
+            agg = agg.assign_coords({obj.dim_name: times})
+        _set_member_index(agg, MemberIndex.from_datasets(datasets, obj.dim_name, coords=None if times is None else times.values))
+        if indexer is not None:
+            agg = agg.isel({obj.dim_name: indexer})
     elif obj.type == AggregationType.JOIN_NEW:
-        agg = xr.concat(datasets, obj.dim_name)
+        agg = _concat(datasets, obj, names, compat)
+        if times is not None:
+            agg = agg.assign_coords({obj.dim_name: times})
     elif obj.type == AggregationType.UNION:
         agg = xr.merge(datasets)
     else:
         raise NotImplementedError
 
-    agg = read_group(agg, ref=None, obj=obj, groups_to_read=[ROOT_GROUP])
+    if lazy and state is not None:
+        # Files are closed along with the state, since later reads of the aggregation reuse them.
+        state[id(obj)] = dataclasses.replace(current, agg=agg)
+        closers = []
+    return _merge_aggregation(target, agg, obj, closers, dropped=dropped)
+
+
+def _concat(datasets: list[xr.Dataset], obj: Aggregation, names: list[str], compat: str | None = None) -> xr.Dataset:
+    """Return concatenation of aggregation members along the aggregation dimension."""
+    if compat != "override":
+        return xr.concat(datasets, obj.dim_name)
+
+    # Members are trusted to share other variables, which are neither compared nor aligned.
+    if obj.type == AggregationType.JOIN_NEW:
+        data_vars = names or "all"
+    else:
+        data_vars = "minimal"
+    return xr.concat(datasets, obj.dim_name, data_vars=data_vars, coords="minimal", compat="override", join="override")
+
+
+def _check_compat(compat: str | None):
+    """Raise error if `compat` argument of `open_ncml` is not supported."""
+    if compat not in (None, "override"):
+        raise ValueError(f"`compat` must be None or 'override', not {compat!r}.")
+
+
+def _merge_aggregation(target: xr.Dataset, agg: xr.Dataset, obj: Aggregation, closers: list[Callable], dropped: list[str]) -> xr.Dataset:
+    """Return `target` merged with concatenated or merged members, once modified by <aggregation>'s content."""
+    agg = read_group(agg, ref=None, obj=obj, groups_to_read=[ROOT_GROUP], dropped=dropped)
     out = target.merge(agg, combine_attrs="no_conflicts")
     out.set_close(partial(_multi_file_closer, closers))
+    if "member_index" in agg.encoding:
+        out.encoding["member_index"] = agg.encoding["member_index"]
+    out.encoding["dropped_variables"] = sorted({*dropped, *_dropped_from(target)})
+    return out
+
+
+def _dropped_from(*datasets: xr.Dataset) -> list[str]:
+    """Return variables of the files of `datasets` that were left out when opening them, see `_open_dataset`."""
+    return sorted({name for ds in datasets for name in ds.encoding.get("dropped_variables", ())})
+
+
+def _set_member_index(agg: xr.Dataset, index: MemberIndex | None):
+    """Store index of the members of joinExisting aggregation in its encoding."""
+    # The encoding of concatenated datasets is shared with their first member.
+    agg.encoding = {key: value for key, value in agg.encoding.items() if key != "member_index"}
+    if index is not None:
+        agg.encoding["member_index"] = index
+
+
+def _decode_time(datasets: list[xr.Dataset], dim_name: str) -> xr.Variable:
+    """Return the decoded time coordinate of the concatenation of members, for aggregations with `timeUnitsChange`."""
+    from xarray.coding.times import CFDatetimeCoder
+
+    # Members sharing units and calendar are decoded together.
+    values = [np.ravel(ds[dim_name].values) for ds in datasets]
+    offsets = np.cumsum([0] + [len(v) for v in values])
+    groups = {}
+    for i, ds in enumerate(datasets):
+        attrs = ds[dim_name].attrs
+        groups.setdefault((attrs.get("units"), attrs.get("calendar")), []).append(i)
+
+    coder = CFDatetimeCoder(use_cftime=True)
+    out = None
+    for members in groups.values():
+        raw = xr.Variable(dim_name, np.concatenate([values[i] for i in members]), datasets[members[0]][dim_name].attrs)
+        decoded = coder.decode(raw, name=dim_name)
+        if len(groups) == 1:
+            return decoded
+        if out is None:
+            # The attributes and encoding of the first member are kept, as by `xr.concat`.
+            out = xr.Variable(dim_name, np.empty(offsets[-1], dtype=decoded.dtype), decoded.attrs, decoded.encoding)
+        out.values[np.concatenate([np.arange(offsets[i], offsets[i + 1]) for i in members])] = decoded.values
     return out
 
 
-def read_ds(obj: Netcdf, ncml: Path) -> xr.Dataset:
+def read_ds(obj: Netcdf, ncml: Path, chunks: int | dict | str | None = None, drop_variables: Iterable[str] = ()) -> xr.Dataset:
     """
     Return dataset defined in <netcdf> element.
 
@@ -249,15 +756,139 @@ def read_ds(obj: Netcdf, ncml: Path) -> xr.Dataset:
       Dataset defined at <netcdf>' `location` attribute.
     """
     if obj.location:
+        return _open_dataset(_resolve_location(obj.location, ncml), decode_times=False, chunks=chunks, drop_variables=list(drop_variables))
+
+
+def _open_dataset(location: str | Path, **kwargs) -> xr.Dataset:
+    """
+    Return dataset opened by `xr.open_dataset`, so that files can be opened from several threads.
+
+    The netCDF4 and HDF5 libraries are not thread-safe, and xarray only holds its lock while opening netCDF4 files and
+    reading their data, not while reading their metadata. The metadata of netCDF4 files is read under the same lock,
+    while the decoding of variables and the creation of indexes still run concurrently.
+
+    The variables of the file left out by `drop_variables` are listed in `encoding["dropped_variables"]`.
+    """
+    from xarray.backends.plugins import guess_engine
+
+    drop_variables = list(kwargs.pop("drop_variables", None) or [])
+    try:
+        engine = guess_engine(location)
+    except ValueError:
+        engine = None
+    if engine != "netcdf4" or "engine" in kwargs:
+        ds = xr.open_dataset(location, **kwargs)
+        dropped = [name for name in drop_variables if name in ds.variables]
+        if dropped:
+            close = ds._close
+            ds = ds.drop_vars(dropped)
+            ds.set_close(close)
+        ds.encoding["dropped_variables"] = dropped
+        return ds
+    location = str(location)
+    if "://" not in location:
+        # As the `source` encoding of variables of files opened from a path.
+        location = str(Path(location).expanduser().absolute())
+    store = _NetCDF4Store.open(location, lock=_NETCDF4_LOCK)
+    try:
+        ds = xr.open_dataset(store, drop_variables=drop_variables, **kwargs)
+        with store.lock:
+            ds.encoding["dropped_variables"] = [name for name in drop_variables if name in store.ds.variables]
+    except BaseException:
+        store.close()
+        raise
+    return ds
+
+
+class _ReentrantLock:
+    """Lock that the thread holding it can acquire again, wrapping a lock shared with other threads."""
+
+    def __init__(self, lock):
+        self._lock = lock
+        self._owner = None
+        self._count = 0
+
+    def acquire(self, blocking: bool = True) -> bool:
+        """Acquire lock, without blocking if the current thread already holds it."""
+        if self._owner == threading.get_ident():
+            self._count += 1
+            return True
+        if not self._lock.acquire(blocking):
+            return False
+        self._owner = threading.get_ident()
+        self._count = 1
+        return True
+
+    def release(self):
+        """Release lock, once released as many times as it was acquired."""
+        self._count -= 1
+        if self._count == 0:
+            self._owner = None
+            self._lock.release()
+
+    def locked(self) -> bool:
+        """Return whether the lock is held."""
+        return self._owner is not None
+
+    def __enter__(self):
+        """Acquire lock."""
+        self.acquire()
+
+    def __exit__(self, *args):
+        """Release lock."""
+        self.release()
+
+    def __reduce__(self) -> str:
+        """Return name of the shared instance, so that it is shared by unpickled stores too."""
+        return "_NETCDF4_LOCK"
+
+
+def _netcdf4_lock() -> _ReentrantLock:
+    from xarray.backends.netCDF4_ import NETCDF4_PYTHON_LOCK
+
+    return _ReentrantLock(NETCDF4_PYTHON_LOCK)
+
+
+# Lock of netCDF4 files opened by `_open_dataset`, held while opening them, reading their metadata and reading their data.
+# It wraps the lock of xarray, also held by `aggregation.probe`, since the store acquires it again while holding it.
+_NETCDF4_LOCK = _netcdf4_lock()
+
+
+class _NetCDF4Store(xr.backends.NetCDF4DataStore):
+    """Store of a netCDF4 file, whose metadata is read under its lock."""
+
+    __slots__ = ()
+
+    def load(self):
+        """Return variables and attributes of file."""
+        with self.lock:
+            return super().load()
+
+    def get_encoding(self):
+        """Return encoding of file."""
+        with self.lock:
+            return super().get_encoding()
+
+    @property
+    def path(self) -> str:
+        """Return path to file, stored in the `source` encoding of the dataset by `xr.open_dataset`."""
+        return self._filename
+
+    def __dask_tokenize__(self):
+        """Return token of file, with its modification time, as for files opened from a path by `xr.open_dataset`."""
         try:
-            # Python >= 3.9
-            location = obj.location.removeprefix("file:")
-        except AttributeError:
-            location = obj.location.strip("file:")
+            mtime = Path(self._filename).stat().st_mtime
+        except OSError:
+            mtime = None
+        return type(self).__name__, self._filename, self._group, mtime
+
 
-        if not Path(location).is_absolute():
-            location = ncml.parent / location
-        return xr.open_dataset(location, decode_times=False)
+def _resolve_location(location: str, ncml: Path) -> Path:
+    """Return path to `location`, resolving relative locations against the directory of the NcML document."""
+    location = Path(location.removeprefix("file:"))
+    if not location.is_absolute():
+        location = ncml.parent / location
+    return location
 
 
 def _get_leaves(group: Netcdf | Group, parent: str | None = None) -> Iterator[str]:
@@ -269,30 +900,34 @@ def _get_leaves(group: Netcdf | Group, parent: str | None = None) -> Iterator[st
         yield from _get_leaves(child, parent=current_path)
 
 
-def _flatten_groups(target: xr.Dataset, ref: xr.Dataset, root_group: Netcdf) -> xr.Dataset:
+def _flatten_groups(target: xr.Dataset, ref: xr.Dataset, root_group: Netcdf, dropped: Iterable[str] = ()) -> xr.Dataset:
     dims = {}
     enums = {}
+    names = _variable_names(target)
     leaves_group = list(_get_leaves(root_group))
-    read_group(target, ref, root_group, groups_to_read=leaves_group, dims=dims, enums=enums)
-    return target
+    return read_group(target, ref, root_group, groups_to_read=leaves_group, dims=dims, enums=enums, names=names, dropped=dropped)
 
 
 def read_group(
-    target: xr.Dataset,
+    target: xr.Dataset | Plan,
     ref: xr.Dataset | None,
     obj: Group | Netcdf,
     groups_to_read: list[str],
     parent_group_path: str = ROOT_GROUP,
     dims: dict = None,
     enums: dict = None,
-) -> xr.Dataset:
+    names: dict[str, dict[str, str]] | None = None,
+    dropped: Iterable[str] = (),
+) -> xr.Dataset | Plan:
     """
     Parse <group> items, typically <dimension>, <variable>, <attribute> and <remove> elements.
 
+    Edits are collected in a `Plan` applied once all items are read, including those of nested groups.
+
     Parameters
     ----------
-    target : xr.Dataset
-      Target dataset to be updated.
+    target : xr.Dataset | Plan
+      Target dataset to be updated, or plan of its edits when reading a nested group.
     ref : xr.Dataset | None
       Reference dataset used to copy content into `target`.
     obj : Group | Netcdf
@@ -303,14 +938,26 @@ def read_group(
       Path of parent group, by default the root group '/'.
     dims : dict[str, Dimension]
       Dictionary of the dimensions of this dataset.
+    enums : dict[str, dict]
+      The enums types that have been read in the parent groups.
+    names : dict[str, dict[str, str]], optional
+      Names of the variables of `target` in each group, by variable name in the NcML document, see `read_variable`.
+      Built from `target` if not given.
+    dropped : Iterable of str
+      Variables of the files of `obj` that were left out when opening them, see `read_remove`.
 
     Returns
     -------
-    xr.Dataset
-      Dataset holding variables and attributes defined in <netcdf> element.
+    xr.Dataset | Plan
+      Dataset holding variables and attributes defined in <netcdf> element, or plan of its edits if `target` is a plan.
     """
+    from .plan import Plan
+
     dims = {} if dims is None else dims
     enums = {} if enums is None else enums
+    names = _variable_names(target) if names is None else names
+    nested = isinstance(target, Plan)
+    target = target if nested else Plan(target)
     for item in obj.choice:
         if isinstance(item, Dimension):
             target = rename_dimension(target, ref, item)
@@ -321,11 +968,11 @@ def read_group(
             else:
                 dims[dim_name] = [read_dimension(item)]
         elif isinstance(item, Variable):
-            target = read_variable(target, ref, item, dims, enums, group_path=parent_group_path)
+            target = read_variable(target, ref, item, dims, enums, group_path=parent_group_path, names=names)
         elif isinstance(item, Attribute):
             read_attribute(target, item, ref)
         elif isinstance(item, Remove):
-            target = read_remove(target, item)
+            target = read_remove(target, item, dropped=dropped)
         elif isinstance(item, EnumTypedef):
             enums[item.name] = read_enum(item)
         elif isinstance(item, Group):
@@ -337,6 +984,7 @@ def read_group(
                     parent_group_path=f"{parent_group_path}{item.name}/",
                     dims=dims,
                     groups_to_read=groups_to_read,
+                    names=names,
                 )
             else:
                 # ignore group
@@ -345,10 +993,17 @@ def read_group(
             pass  # <aggregation> elements are parsed in `read_netcdf`
         else:
             raise AttributeError
-    return target
+    return target if nested else target.apply()
 
 
-def read_scan(obj: Aggregation.Scan, ncml: Path) -> list[xr.Dataset]:
+def read_scan(
+    obj: Aggregation.Scan,
+    ncml: Path,
+    parallel: int | Executor | None = None,
+    chunks: int | dict | str | None = None,
+    drop_variables: Iterable[str] = (),
+    select: Callable[[xr.Dataset], list[str]] | None = None,
+) -> list[xr.Dataset]:
     """
     Return list of datasets defined in <scan> element.
 
@@ -358,41 +1013,111 @@ def read_scan(obj: Aggregation.Scan, ncml: Path) -> list[xr.Dataset]:
       <scan> object description.
     ncml : Path
       Path to NcML document, sometimes required to follow relative links.
+    parallel : int | Executor, optional
+      Number of threads, or executor, used to walk directories and open the files concurrently.
+    chunks : int | dict | str, optional
+      Chunk sizes of the dask arrays holding the data of files, passed to `xr.open_dataset`.
+    drop_variables : Iterable of str
+      Variables that are not read from files.
+    select : Callable, optional
+      Function called with the dataset of the first file, returning the variables that are not read from the others.
 
     Returns
     -------
     list
       List of datasets found by scan.
     """
-    import glob
-    import re
+    files = scan_files(obj, ncml, parallel=parallel)
+    opened, _ = _open_projected(partial(_open_dataset, decode_times=False, chunks=chunks), files, parallel, drop_variables, select)
+    return [ds for _, ds in opened]
 
-    if obj.date_format_mark:
-        raise NotImplementedError
+
+def scan_files(obj: Aggregation.Scan, ncml: Path, parallel: int | Executor | None = None, stats: dict | None = None) -> list[str]:
+    """
+    Return sorted list of the files selected by <scan> element.
+
+    Parameters
+    ----------
+    obj : Aggregation.Scan instance
+      <scan> object description.
+    ncml : Path
+      Path to NcML document, sometimes required to follow relative links.
+    parallel : int | Executor, optional
+      Number of threads, or executor, used to walk directories concurrently.
+    stats : dict, optional
+      Dictionary updated with the `os.stat_result` of the files found, by path.
+
+    Returns
+    -------
+    list
+      Paths to the files found by scan.
+
+    Notes
+    -----
+    Files modified more recently than the `olderThan` duration are left out, as they may still be being written. If
+    `dateFormatMark` is set, files are sorted by the date embedded in their name rather than by path.
+    """
+    from .scan import dates_from_names, matcher, parse_duration, walk
 
     path = Path(obj.location)
     if not path.is_absolute():
         path = ncml.parent / path
 
-    files = list(path.rglob("*") if obj.subdirs else path.glob("*"))
+    modified_before = None
+    if obj.older_than:
+        modified_before = time.time() - parse_duration(obj.older_than).total_seconds()
 
-    if not files:
+    # Locations that are not a directory hold no file, as when the tree was listed with `Path.glob`.
+    if not path.is_dir():
         raise ValueError(f"No files found in {path}")
 
-    fns = map(str, files)
-    if obj.reg_exp:
-        pat = re.compile(obj.reg_exp)
-        files = list(filter(pat.match, fns))
-    elif obj.suffix:
-        pat = "*" + obj.suffix
-        files = glob.fnmatch.filter(fns, pat)
+    entries, count = walk(path, subdirs=obj.subdirs, match=matcher(obj.reg_exp, obj.suffix), parallel=parallel, modified_before=modified_before)
 
-    if not files:
+    if not count:
+        raise ValueError(f"No files found in {path}")
+
+    if not entries:
+        if obj.older_than:
+            raise ValueError(f"regular expression or suffix matches no file older than {obj.older_than}.")
         raise ValueError("regular expression or suffix matches no file.")
 
-    files.sort()
+    if stats is not None:
+        stats.update((entry.path, entry.stat()) for entry in entries)
+
+    files = [entry.path for entry in entries]
+    if obj.date_format_mark:
+        order = np.argsort(dates_from_names(files, obj.date_format_mark), kind="stable")
+        files = [files[i] for i in order]
+    return files
 
-    return [xr.open_dataset(f, decode_times=False) for f in files]
+
+def read_scan_dates(datasets: list[xr.Dataset], locations: list[str], obj: Aggregation.Scan, agg: Aggregation) -> list[xr.Dataset]:
+    """
+    Return datasets with the aggregation coordinate set to the dates embedded in file names by `dateFormatMark`.
+
+    Parameters
+    ----------
+    datasets : list of xr.Dataset
+      Datasets of the files found by scan.
+    locations : list of str
+      Paths to the files.
+    obj : Aggregation.Scan instance
+      <scan> object description.
+    agg : Aggregation instance
+      <aggregation> object description.
+
+    Returns
+    -------
+    list
+      Datasets with their date as coordinate along the aggregation dimension. Members of joinExisting aggregations must
+      have a single element along that dimension.
+    """
+    from .scan import dates_from_names
+
+    dates = dates_from_names(locations, obj.date_format_mark)
+    if agg.type == AggregationType.JOIN_NEW:
+        return [ds.assign_coords({agg.dim_name: date}) for ds, date in zip(datasets, dates, strict=True)]
+    return [ds.assign_coords({agg.dim_name: dates[i : i + 1]}) for i, ds in enumerate(datasets)]
 
 
 def read_coord_value(nc: Netcdf, agg: Aggregation, dtypes: list = ()):
@@ -467,19 +1192,20 @@ def read_enum(obj: EnumTypedef) -> dict[str, list]:
 
 
 def read_variable(
-    target: xr.Dataset,
+    target: xr.Dataset | Plan,
     ref: xr.Dataset,
     obj: Variable,
     dimensions: dict,
     enums: dict[str, dict[str, int]],
     group_path: str,
-) -> xr.Dataset:
+    names: dict[str, dict[str, str]] | None = None,
+) -> xr.Dataset | Plan:
     """
     Parse <variable> element.
 
     Parameters
     ----------
-    target : xr.Dataset
+    target : xr.Dataset | Plan
       Target dataset to be updated.
     ref : xr.Dataset
       Reference dataset used to copy content into `target`.
@@ -491,11 +1217,15 @@ def read_variable(
       The enums types that have been read in the parent groups.
     group_path : str
       Path to the parent group.
+    names : dict[str, dict[str, str]], optional
+      Names of the variables of `target` in each group, by variable name in the NcML document. Variables of different
+      groups sharing the same name are suffixed with `__n`, `n` being the number of groups in which the name was found
+      before. Updated with the name of the variable. Built from `target` if not given.
 
     Returns
     -------
-    xr.Dataset
-      Dataset holding variable defined in <variable> element.
+    xr.Dataset | Plan
+      Dataset holding variable defined in <variable> element, or `target` plan with the variable added.
     """
     # Handle logic for variable name change
     if obj.org_name:
@@ -514,12 +1244,12 @@ def read_variable(
     if (existing_var := target.get(var_name)) is not None and existing_var.attrs.get("group_path") in [None, group_path]:
         out = xr.as_variable(target[var_name])
         if obj.type:
-            out = out.astype(nctype(obj.type))
+            out = _astype(out, nctype(obj.type))
         ref_var = None
     elif (existing_var := ref.get(var_name)) is not None and existing_var.attrs.get("group_path") in [None, group_path]:
         out = xr.as_variable(ref[var_name])
         if obj.type:
-            out = out.astype(nctype(obj.type))
+            out = _astype(out, nctype(obj.type))
         ref_var = ref[var_name]
     elif obj.shape:
         var_dims = []
@@ -532,7 +1262,13 @@ def read_variable(
             if (dim_count := len(dimensions[dim])) > 1:
                 dim = f"{dim}__{dim_count - 1}"
             var_dims.append(dim)
-        out = xr.Variable(data=np.empty(shape, dtype=nctype(obj.type)), dims=var_dims)
+        if obj.values:
+            # Values are read below, until then the variable only holds its shape and type.
+            data = np.broadcast_to(np.zeros((), dtype=nctype(obj.type)), shape)
+        else:
+            fill_value = next((cast(item) for item in obj.attribute if item.name == "_FillValue"), None)
+            data = fill_values(shape, nctype(obj.type), fill_value)
+        out = xr.Variable(data=data, dims=var_dims)
     elif obj.shape == "":
         out = build_scalar_variable(var_name=var_name, values_tag=obj.values, var_type=obj.type)
     else:
@@ -550,8 +1286,7 @@ def read_variable(
 
     # Read values for arrays (already done for a scalar)
     if obj.values and obj.shape != "":
-        data = read_values(var_name, out.size, obj.values)
-        data = out.dtype.type(data)
+        data = read_values(var_name, out.size, obj.values, dtype=str if out.dtype.kind == "U" else out.dtype)
         out = xr.Variable(
             out.dims,
             data,
@@ -570,21 +1305,79 @@ def read_variable(
     if obj.typedef in enums.keys():
         dtype = out.dtype
         new_dtype = np.dtype(dtype, metadata={"enum": enums[obj.typedef], "enum_name": obj.typedef})
+        out = _astype(out, new_dtype)
         out.encoding["dtype"] = new_dtype
-        out = out.astype(new_dtype)
     elif obj.typedef is not None:
         raise NotImplementedError
-    import re
 
-    reg = re.compile(f"^{var_name}__|{var_name}")
-    similar_vars_but_diff_path = [v for v in target.data_vars if reg.match(v) and target[v].attrs.get("group_path") not in [None, group_path]]
-    if len(similar_vars_but_diff_path) > 0:
-        var_name = f"{var_name}__{len(similar_vars_but_diff_path)}"
+    paths = (_variable_names(target) if names is None else names).setdefault(var_name, {})
+    if group_path not in paths:
+        paths[group_path] = f"{var_name}__{len(paths)}" if paths else var_name
+    var_name = paths[group_path]
     target[var_name] = out
     return target
 
 
-def read_values(var_name: str, expected_size: int, values_tag: Values) -> list:
+def _variable_names(target: xr.Dataset) -> dict[str, dict[str, str]]:
+    """Return names of the variables of dataset read from groups, by group path and name without `__n` suffix."""
+    import re
+
+    out = {}
+    for name, var in target.data_vars.items():
+        if (group_path := var.attrs.get("group_path")) is not None:
+            out.setdefault(re.sub(r"__\d+$", "", name), {})[group_path] = name
+    return out
+
+
+def _astype(var: xr.Variable, dtype) -> xr.Variable:
+    """Return variable cast to `dtype`, as its data is read if it is not in memory."""
+    from xarray.coding.variables import lazy_elemwise_func, unpack_for_decoding
+
+    dtype = np.dtype(dtype)
+    dims, data, attrs, encoding = unpack_for_decoding(var)
+    # The type in which values are stored in the file, and how they are packed in it, do not apply to the new type.
+    encoding = {key: value for key, value in encoding.items() if key not in _TYPE_ENCODING}
+    # The length of strings is only known once cast.
+    if isinstance(data, np.ndarray) or isinstance(var, xr.IndexVariable) or dtype.itemsize == 0:
+        out = var.astype(dtype)
+        out.encoding = encoding
+        return out
+    return xr.Variable(dims, lazy_elemwise_func(data, partial(np.asarray, dtype=dtype), dtype), attrs, encoding)
+
+
+# Encoding of variables that depends on their type.
+_TYPE_ENCODING = ("dtype", "_FillValue", "missing_value", "scale_factor", "add_offset", "_Unsigned")
+
+
+def arange(start: float, increment: float, num: int, dtype=None):
+    """
+    Return lazy array of values given by the `start` and `increment` attributes of a <values> element.
+
+    Values are computed by chunk when read, so that regular coordinates take no memory until then.
+
+    Parameters
+    ----------
+    start : float
+      First value.
+    increment : float
+      Difference between consecutive values.
+    num : int
+      Number of values.
+    dtype : np.dtype, optional
+      Data type of values.
+
+    Returns
+    -------
+    dask.array.Array
+      One-dimensional array of values.
+    """
+    import dask.array as da
+
+    data = start + da.arange(num, chunks="auto") * increment
+    return data if dtype is None else data.astype(dtype)
+
+
+def read_values(var_name: str, expected_size: int, values_tag: Values, dtype=None) -> np.ndarray:
     """
     Read values for <variable> element.
 
@@ -596,18 +1389,19 @@ def read_values(var_name: str, expected_size: int, values_tag: Values) -> list:
       The variable expected size.
     values_tag : Values instance
       <values> object description
+    dtype : np.dtype, optional
+      Data type of values. If not given, values are strings.
 
     Returns
     -------
-    list
-      A list filled with values from <values> element.
+    np.ndarray or dask.array.Array
+      An array filled with values from <values> element, computed lazily if given by `start` and `increment`.
     """
     if values_tag.from_attribute is not None:
         error_msg = f"xncml cannot yet fetch values from a global or a variable attribute using <from_attribute>, here on variable {var_name}."
         raise NotImplementedError(error_msg)
     if values_tag.start is not None and values_tag.increment is not None:
-        number_of_values = int(values_tag.npts or expected_size)
-        return values_tag.start + np.arange(number_of_values) * values_tag.increment
+        return arange(values_tag.start, values_tag.increment, int(values_tag.npts or expected_size), dtype)
     if not isinstance(values_tag.content, list):
         error_msg = f"Unsupported format of the <values> tag from variable {var_name}."
         raise NotImplementedError(error_msg)
@@ -617,14 +1411,111 @@ def read_values(var_name: str, expected_size: int, values_tag: Values) -> list:
     if not isinstance(values_tag.content[0], str):
         error_msg = f"Unsupported format of the <values> tag from variable {var_name}."
         raise NotImplementedError(error_msg)
-    separator = values_tag.separator or " "
-    data = values_tag.content[0].split(separator)
+    data = decode_values(values_tag.content[0], dtype, values_tag.separator or " ")
     if len(data) > expected_size:
         error_msg = f"The expected size for variable {var_name} was {expected_size}, but {len(data)} values were found in its <values> tag."
         raise ValueError(error_msg)
     return data
 
 
+def decode_values(text: str, dtype=None, separator: str = " ") -> np.ndarray:
+    """
+    Return array of values listed in the text of a <values> element.
+
+    Numbers are parsed by NumPy straight from the text, without splitting it into a list of strings first. Strings, and
+    text that cannot be parsed entirely as numbers of the given type, are split on the separator and then converted.
+
+    Parameters
+    ----------
+    text : str
+      Values, separated by `separator`.
+    dtype : np.dtype, optional
+      Data type of values. If not given, values are strings.
+    separator : str
+      Separator between values. A space matches any whitespace, as for `np.fromstring`.
+
+    Returns
+    -------
+    np.ndarray
+      One-dimensional array of values.
+    """
+    dtype = np.dtype(str if dtype is None else dtype)
+    if dtype.kind in "iuf":
+        # Integers are parsed with the widest type of their kind, so that overflows are detected rather than wrapped.
+        wide = {"i": np.int64, "u": np.uint64}.get(dtype.kind, dtype)
+        with catch_warnings():
+            # Older versions of NumPy only warn about text that cannot be parsed.
+            simplefilter("error", DeprecationWarning)
+            try:
+                data = np.fromstring(text, dtype=wide, sep=separator)
+            except (DeprecationWarning, ValueError):
+                data = None
+        if data is not None:
+            out = data.astype(dtype)
+            if wide is dtype or np.array_equal(out, data):
+                return out
+    return np.array(text.split(separator), dtype=dtype)
+
+
+# Default fill values of netCDF, by data type.
+_DEFAULT_FILL_VALUES = {
+    "i1": -127,
+    "u1": 255,
+    "i2": -32767,
+    "u2": 65535,
+    "i4": -2147483647,
+    "u4": 4294967295,
+    "i8": -9223372036854775806,
+    "u8": 18446744073709551614,
+    "f4": 9.969209968386869e36,
+    "f8": 9.969209968386869e36,
+}
+
+
+def fill_values(shape: list[int] | tuple[int, ...], dtype, fill_value=None):
+    """
+    Return lazy array of fill values, holding the data of variables declared in NcML without values.
+
+    Parameters
+    ----------
+    shape : sequence of int
+      Shape of the variable.
+    dtype : np.dtype
+      Data type of the variable.
+    fill_value : scalar, optional
+      Fill value, as given by the `_FillValue` attribute. Strings, read from attributes declared without a type, are
+      converted to `dtype`. Defaults to the default fill value of netCDF for `dtype`, or to an empty string.
+
+    Returns
+    -------
+    dask.array.Array
+      Array filled with `fill_value`, taking no memory until computed.
+
+    Raises
+    ------
+    ValueError
+      If `fill_value` is a string that is not a single value of type `dtype`.
+    """
+    import dask.array as da
+
+    dtype = np.dtype(dtype)
+    if dtype.kind == "U" and dtype.itemsize == 0:
+        dtype = np.dtype("U1")
+    if isinstance(fill_value, tuple):
+        fill_value = fill_value[0]
+    if fill_value is None:
+        fill_value = _DEFAULT_FILL_VALUES.get(dtype.str[1:], "")
+    elif isinstance(fill_value, str) and dtype.kind != "U":
+        try:
+            values = decode_values(fill_value.strip(), dtype)
+        except (ValueError, OverflowError) as err:
+            raise ValueError(f"_FillValue {fill_value!r} cannot be converted to {dtype}.") from err
+        if values.size != 1:
+            raise ValueError(f"_FillValue {fill_value!r} is not a single value of type {dtype}.")
+        fill_value = values[0]
+    return da.full(shape, fill_value, dtype=dtype, chunks="auto")
+
+
 def build_scalar_variable(var_name: str, values_tag: Values, var_type: str) -> xr.Variable:
     """
     Build an xr.Variable for scalar variables.
@@ -657,47 +1548,50 @@ def build_scalar_variable(var_name: str, values_tag: Values, var_type: str) -> x
             stacklevel=2,
         )
         return xr.Variable(data=default_value, dims=())
-    values_content = read_values(var_name, expected_size=1, values_tag=values_tag)
+    values_content = read_values(var_name, expected_size=1, values_tag=values_tag, dtype=nctype(var_type))
     if len(values_content) == 1:
-        return xr.Variable(data=np.array(values_content[0], dtype=nctype(var_type))[()], dims=())
+        return xr.Variable(data=values_content[0], dims=())
     if len(values_content) > 1:
         error_msg = f'Multiple values found for variable {var_name} but its shape is "" thus a single scalar is expected within its <values> tag.'
     raise ValueError(error_msg)
 
 
-def read_remove(target: xr.Dataset | xr.Variable, obj: Remove) -> xr.Dataset:
+def read_remove(target: xr.Dataset | Plan | xr.Variable, obj: Remove, dropped: Iterable[str] = ()) -> xr.Dataset | Plan | xr.Variable:
     """
     Remove item from dataset.
 
     Parameters
     ----------
-    target : xr.Dataset | xr.Variable
+    target : xr.Dataset | Plan | xr.Variable
       Target dataset or variable to be updated.
     obj : Remove instance
       <remove> object description.
+    dropped : Iterable of str
+      Variables of the files that were left out when opening them. Removing them is not an error if they are missing.
 
     Returns
     -------
-    xr.Dataset or xr.Variable
+    xr.Dataset or Plan or xr.Variable
       Dataset with attribute, variable or dimension removed, or variable with attribute removed.
     """
     if obj.type == ObjectType.ATTRIBUTE:
         target.attrs.pop(obj.name)
     elif obj.type == ObjectType.VARIABLE:
-        target = target.drop_vars(obj.name)
+        # Variables removed from a <netcdf> or <aggregation> element are not read from its files in the first place.
+        target = target.drop_vars(obj.name, errors="ignore" if obj.name in dropped else "raise")
     elif obj.type == ObjectType.DIMENSION:
         target = target.drop_dims(obj.name)
 
     return target
 
 
-def read_attribute(target: xr.Dataset | xr.Variable, obj: Attribute, ref: xr.Dataset = None):
+def read_attribute(target: xr.Dataset | Plan | xr.Variable, obj: Attribute, ref: xr.Dataset = None):
     """
     Update target dataset in place with new or modified attribute.
 
     Parameters
     ----------
-    target : xr.Dataset | xr.Variable
+    target : xr.Dataset | Plan | xr.Variable
       Target dataset to be updated.
     obj : Attribute instance
       <attribute> object description.
@@ -719,14 +1613,14 @@ def read_attribute(target: xr.Dataset | xr.Variable, obj: Attribute, ref: xr.Dat
 
 
 def read_dimension(obj: Dimension) -> Dimension:
-    """Return dimension object with its length cast to an integer."""
+    """Return copy of dimension object with its length cast to an integer."""
     if obj.length is not None:
-        obj.length = int(obj.length)
+        return dataclasses.replace(obj, length=int(obj.length))
 
     return obj
 
 
-def rename_dimension(target: xr.Dataset, ref: xr.Dataset, obj: Dimension) -> xr.Dataset:
+def rename_dimension(target: xr.Dataset | Plan, ref: xr.Dataset, obj: Dimension) -> xr.Dataset | Plan:
     """Rename dimension in target dataset."""
     if obj.org_name:
         if obj.org_name in target.dims:
@@ -787,6 +1681,320 @@ def filter_by_class(iterable, klass):
             yield item
 
 
+def _read_member(item: Netcdf, ncml: Path, **kwargs) -> xr.Dataset:
+    """Return dataset of aggregation member, with options of `read_netcdf` given as keyword arguments."""
+    return read_netcdf(xr.Dataset(), ref=xr.Dataset(), obj=item, ncml=ncml, group=ROOT_GROUP, **kwargs)
+
+
+@dataclasses.dataclass(frozen=True)
+class _MemberRef:
+    """Attributes of a <netcdf> aggregation member still needed once it is read, so that the member is not kept."""
+
+    location: str | None
+    coord_value: str | None
+    ncoords: int | None
+    # Whether the member only points to a file.
+    plain: bool
+
+    @classmethod
+    def of(cls, item: Netcdf) -> _MemberRef:
+        """Return reference to <netcdf> member."""
+        plain = bool(item.location) and not item.choice and item.explicit is None
+        return cls(item.location, item.coord_value, item.ncoords, plain)
+
+
+@dataclasses.dataclass
+class _LazyAggregation:
+    """State of a joinExisting aggregation whose members are read lazily."""
+
+    # Locations of the <netcdf> members read lazily.
+    plain: list[str]
+    # Locations of all files read lazily, including those found by <scan> elements.
+    locations: list[str]
+    # Dataset of the first file, template for the others.
+    template: xr.Dataset | None
+    # Functions closing the opened files.
+    closers: list[Callable]
+    # Concatenated members.
+    agg: xr.Dataset | None = None
+
+
+def _read_members_lazily(
+    obj: Aggregation,
+    ncml: Path,
+    read_member: Callable,
+    parallel: Executor | None = None,
+    manifest: Manifest | None = None,
+    chunks: int | dict | str | None = None,
+    drop_variables: Iterable[str] = (),
+    select: Callable[[xr.Dataset], list[str]] | None = None,
+) -> tuple[list[tuple[_MemberRef, xr.Dataset]], list[xr.Dataset], _LazyAggregation]:
+    """
+    Return the datasets of joinExisting aggregation members, reading member files lazily.
+
+    Members that only point to a file, and files found by <scan> elements, are probed for their layout along the
+    aggregation dimension, and their variables are dask arrays reading the file when computed. Members declaring both
+    `ncoords` and `coordValue` are not probed, so that only the first file is opened, as a template. Other members are
+    read with `read_member`. If a `manifest` is given, files are only probed if they are not recorded in it, or were
+    modified since. Variables in `drop_variables`, or returned by `select` for the template, are left out of the
+    datasets.
+
+    Returns
+    -------
+    list
+      (reference, dataset) pairs of <netcdf> members.
+    list
+      Datasets of scanned files.
+    _LazyAggregation
+      State of the aggregation, holding the functions closing the opened files.
+    """
+    from .aggregation import Member
+
+    # Members are consumed once, since they may be streamed from the NcML document, and only their references are kept,
+    # along with the members that are read with `read_member`.
+    refs, nested = [], []
+    for item in obj.netcdf:
+        ref = _MemberRef.of(item)
+        refs.append(ref)
+        if not ref.plain:
+            nested.append(item)
+    locations = [str(_resolve_location(ref.location, ncml)) for ref in refs if ref.plain]
+    current = _LazyAggregation(plain=list(locations), locations=locations, template=None, closers=[])
+    stats = None if manifest is None else {}
+    scanned, dated = _scan_lazily(obj, ncml, parallel, stats)
+    locations.extend(scanned)
+
+    opened = _open_datasets(partial(read_member, drop_variables=drop_variables), nested, parallel, key=_MemberRef.of)
+    del nested
+    current.closers.extend(tar._close for _, tar in opened)
+    lazy = []
+    try:
+        if locations:
+            # The first file is the template for the structure and metadata of the others.
+            template = _open_dataset(locations[0], decode_times=False, chunks=chunks, drop_variables=list(drop_variables))
+            current.closers.append(template._close)
+            if select is not None:
+                template = template.drop_vars(select(template))
+            current.template = template
+            dtypes = [template[obj.dim_name].dtype.type] if obj.dim_name in template else []
+
+            # Members declaring their length and coordinate values need not be probed.
+            known = {}
+            for i, ref in enumerate(ref for ref in refs if ref.plain):
+                if ref.ncoords is not None and ref.coord_value is not None:
+                    coords = np.atleast_1d(read_coord_value(ref, obj, dtypes=dtypes))
+                    if len(coords) != int(ref.ncoords):
+                        msg = f"Member {ref.location} declares ncoords={ref.ncoords} but {len(coords)} values in coordValue."
+                        raise ValueError(msg)
+                    known[i] = Member(locations[i], int(ref.ncoords), coords)
+
+            missing = [loc for i, loc in enumerate(locations) if i not in known and loc not in dated]
+            probed = iter(_probe(missing, obj.dim_name, parallel, manifest, stats))
+            for i, loc in enumerate(locations):
+                member = known.get(i) or dated.get(loc) or next(probed)
+                lazy.append(_member_dataset(template, member, obj.dim_name, dated=loc in dated, chunks=chunks))
+                current.closers.append(lazy[-1]._close)
+    except BaseException:
+        _multi_file_closer(current.closers)
+        raise
+
+    lazy = iter(lazy)
+    others = iter(tar for _, tar in opened)
+    members = [(ref, next(lazy) if ref.plain else next(others)) for ref in refs]
+    return members, list(lazy), current
+
+
+def _append_members(
+    obj: Aggregation,
+    ncml: Path,
+    previous: _LazyAggregation,
+    parallel: Executor | None = None,
+    manifest: Manifest | None = None,
+    chunks: int | dict | str | None = None,
+    compat: str | None = None,
+) -> xr.Dataset | None:
+    """
+    Return the previous concatenation of members, extended with the files found by <scan> elements since.
+
+    Only new files are probed. If files were removed, or new files are not sorted after the previous ones, None is
+    returned, and the aggregation must be read anew.
+    """
+    from .aggregation import MemberIndex
+
+    stats = None if manifest is None else {}
+    scanned, dated = _scan_lazily(obj, ncml, parallel, stats)
+    locations = previous.plain + scanned
+
+    n = len(previous.locations)
+    if previous.template is None or locations[:n] != previous.locations:
+        return None
+
+    if added := locations[n:]:
+        probed = iter(_probe([loc for loc in added if loc not in dated], obj.dim_name, parallel, manifest, stats))
+        datasets = [
+            _member_dataset(previous.template, dated.get(loc) or next(probed), obj.dim_name, dated=loc in dated, chunks=chunks) for loc in added
+        ]
+        previous.closers.extend(ds._close for ds in datasets)
+        added_agg = _concat(datasets, obj, [], compat)
+        times = None
+        if obj.time_units_change:
+            times = _decode_time(datasets, obj.dim_name)
+            added_agg = added_agg.assign_coords({obj.dim_name: times})
+        agg = _concat([previous.agg, added_agg], obj, [], compat)
+        index = previous.agg.encoding.get("member_index")
+        added_index = MemberIndex.from_datasets(datasets, obj.dim_name, coords=None if times is None else times.values)
+        if index is not None and added_index is not None:
+            index = index.extend(added_index)
+        else:
+            index = None
+        _set_member_index(agg, index)
+        previous.agg = agg
+        previous.locations = locations
+    return previous.agg
+
+
+def _scan_lazily(obj: Aggregation, ncml: Path, parallel: Executor | None = None, stats: dict | None = None) -> tuple[list[str], dict]:
+    """Return files found by <scan> elements, and the layout of those whose date is given by their name, by path."""
+    from .aggregation import Member
+    from .scan import dates_from_names
+
+    locations = []
+    dated = {}
+    for item in obj.scan:
+        files = scan_files(item, ncml, parallel=parallel, stats=stats)
+        if item.date_format_mark:
+            dates = dates_from_names(files, item.date_format_mark)
+            dated.update((fn, Member(fn, 1, dates[i : i + 1])) for i, fn in enumerate(files))
+        locations.extend(files)
+    return locations, dated
+
+
+def _member_dataset(template: xr.Dataset, member: Member, dim_name: str, dated: bool = False, chunks: int | dict | str | None = None) -> xr.Dataset:
+    """Return lazy member dataset, whose coordinate replaces the template's if it is given by the file name."""
+    from .aggregation import member_dataset
+
+    ds = member_dataset(template, member, dim_name, chunks=chunks)
+    ds.encoding["dropped_variables"] = template.encoding.get("dropped_variables", [])
+    if dated:
+        # As with `read_scan_dates`, the attributes of the coordinate read from file do not apply to dates.
+        close = ds._close
+        ds = ds.assign_coords({dim_name: member.coords})
+        ds.set_close(close)
+    return ds
+
+
+def _probe(
+    locations: list[str], dim_name: str, parallel: Executor | None = None, manifest: Manifest | None = None, stats: dict | None = None
+) -> list:
+    """Return the layout of files along the aggregation dimension, recorded in `manifest` if given."""
+    from .aggregation import probe_members
+
+    if manifest is None:
+        return probe_members(locations, dim_name, parallel)
+    members = manifest.probe_members(locations, dim_name, parallel, stats=stats)
+    manifest.save()
+    return members
+
+
+def _dropped_variables(obj: Netcdf | Aggregation, drop_variables: Iterable[str] = ()) -> list[str]:
+    """Return variables that need not be read from the files of <netcdf> or <aggregation> element."""
+    # Variables removed by <remove> elements, unless <variable> elements refer to them, for instance to rename them.
+    removed = {item.name for item in filter_by_class(obj.choice, Remove) if item.type == ObjectType.VARIABLE}
+    referred = {name for item in filter_by_class(obj.choice, Variable) for name in (item.name, item.org_name)}
+    return sorted((removed | set(drop_variables)) - referred)
+
+
+def _unselected_variables(ds: xr.Dataset, names: list[str], dim_name: str) -> list[str]:
+    """Return variables of `ds` that are neither selected by <variableAgg> elements, nor their coordinates."""
+    keep = set(ds[names].variables) | {dim_name}
+    return [name for name in ds.variables if name not in keep]
+
+
+def _open_projected(
+    func: Callable,
+    items: Iterable,
+    parallel: Executor | None,
+    drop_variables: Iterable[str],
+    select: Callable | None = None,
+    key: Callable | None = None,
+) -> tuple[list[tuple[Any, xr.Dataset]], list[str]]:
+    """
+    Return (item, dataset) pairs opened by `func`, called with `drop_variables`, and variables not read from datasets.
+
+    If `select` is given, the first item is opened on its own, and the variables returned by `select` for its dataset are
+    not read from the other items. If `key` is given, pairs hold `key(item)` instead of the item, as in `_open_datasets`.
+    """
+    # Items are consumed once, since they may be streamed from the NcML document.
+    items = iter(items)
+    drop_variables = list(drop_variables)
+    opened = _open_datasets(partial(func, drop_variables=drop_variables), islice(items, 1 if select else 0), key=key)
+    try:
+        if opened:
+            drop_variables = [*drop_variables, *select(opened[0][1])]
+        opened.extend(_open_datasets(partial(func, drop_variables=drop_variables), items, parallel, key=key))
+    except BaseException:
+        for _, ds in opened:
+            ds.close()
+        raise
+    return opened, drop_variables
+
+
+def _depends_on_dim(obj: Netcdf | Aggregation, dim_name: str) -> bool:
+    """Return whether <netcdf> or <aggregation> element defines values along, or modifies, dimension `dim_name`."""
+    for item in obj.choice:
+        if isinstance(item, Dimension) and dim_name in (item.name, item.org_name):
+            return True
+        # The shape of variables defined with their values is not known if not given.
+        if isinstance(item, Variable) and item.values is not None and (item.shape is None or dim_name in item.shape.split()):
+            return True
+    return False
+
+
+def _select_members(
+    datasets: list[xr.Dataset], dim_name: str, isel=None, sel=None, coords: np.ndarray | None = None
+) -> tuple[np.ndarray, Any] | None:
+    """
+    Return the positions of members overlapping a selection along the aggregation dimension, and the selection within
+    their concatenation.
+
+    Positions `isel` are selected first, then labels `sel`, matched against `coords` if given, or else against the
+    coordinates of members. None is returned if labels are given and the coordinates of members are not all in memory.
+    """
+    sizes = np.array([ds.sizes[dim_name] for ds in datasets], dtype=int)
+    offsets = np.concatenate([[0], np.cumsum(sizes)])
+    positions = np.arange(offsets[-1])
+    if isel is not None:
+        positions = positions[isel]
+    if sel is not None:
+        if coords is None:
+            if not all(dim_name in ds.indexes for ds in datasets):
+                return None
+            coords = np.concatenate([ds.indexes[dim_name].to_numpy() for ds in datasets])
+        positions = xr.DataArray(positions, coords={dim_name: coords[positions]}, dims=dim_name).sel({dim_name: sel}).values
+
+    # Member holding each position, and its offset once only the selected members are concatenated.
+    member = np.searchsorted(offsets, positions, side="right") - 1
+    keep = np.unique(member)
+    if not keep.size:
+        return np.array([0]), slice(0, 0)
+    new_offsets = np.zeros(len(datasets), dtype=int)
+    new_offsets[keep] = np.concatenate([[0], np.cumsum(sizes[keep])[:-1]])
+    indexer = positions - offsets[member] + new_offsets[member]
+
+    if indexer.ndim == 0:
+        indexer = int(indexer)
+    elif (step := indexer[1] - indexer[0] if indexer.size > 1 else 1) > 0 and np.all(np.diff(indexer) == step):
+        # Evenly spaced positions are selected by a slice, which keeps dask arrays lazily sliced.
+        indexer = slice(int(indexer[0]), int(indexer[-1]) + 1, int(step))
+    return keep, indexer
+
+
+def _file_chunks(chunks: int | dict | str | None) -> int | dict | str | None:
+    """Return `chunks` argument of `xr.open_dataset`, given the `chunks` argument of `open_ncml`."""
+    # A single chunk per variable of each file.
+    return -1 if chunks == "file-aligned" else chunks
+
+
 def _multi_file_closer(closers):
     """Close multiple files."""
     # Note that if a closer is None, it probably means an alteration was made to the original dataset. Make sure
@@ -794,3 +2002,50 @@ def _multi_file_closer(closers):
     for closer in closers:
         if closer is not None:
             closer()
+
+
+@contextmanager
+def _executor(parallel: int | Executor | None) -> Iterator[Executor | None]:
+    """Return executor, creating a thread pool if given a number of threads."""
+    if parallel is None or isinstance(parallel, Executor):
+        yield parallel
+    else:
+        with ThreadPoolExecutor(max_workers=parallel) as executor:
+            yield executor
+
+
+def _open_datasets(
+    func: Callable, items: Iterable, parallel: int | Executor | None = None, key: Callable | None = None
+) -> list[tuple[Any, xr.Dataset]]:
+    """
+    Return list of (item, dataset) pairs, where datasets are opened by calling `func` on each item.
+
+    Datasets are opened concurrently if `parallel` is given, but are always returned in the order of `items`. If `key` is
+    given, pairs hold `key(item)` instead of the item, which is not kept once its dataset is opened. If any call fails,
+    datasets already opened are closed before the error is raised.
+    """
+    key = key or (lambda item: item)
+    out = []
+    with _executor(parallel) as executor:
+        try:
+            if executor is None:
+                for item in items:
+                    out.append((key(item), func(item)))  # noqa: PERF401
+            else:
+                futures = [(key(item), executor.submit(func, item)) for item in items]
+                try:
+                    for item, future in futures:
+                        out.append((item, future.result()))
+                except BaseException:
+                    for _, future in futures:
+                        future.cancel()
+                    # Wait for calls already running, so their datasets can be closed too.
+                    for item, future in futures[len(out) :]:
+                        if not future.cancelled() and future.exception() is None:
+                            out.append((item, future.result()))
+                    raise
+        except BaseException:
+            for _, ds in out:
+                ds.close()
+            raise
+    return out
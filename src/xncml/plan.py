@@ -0,0 +1,229 @@
+"""
+# Transformation plans
+
+The elements of a <netcdf> or <group> element are read one after the other, each renaming, removing or defining
+variables, dimensions and attributes. Applied directly to an `xarray.Dataset`, every such edit returns a new dataset and
+rebuilds its indexes, so that the cost of reading a document grows with the product of the number of edits and the
+number of variables.
+
+A `Plan` stands in for the dataset while the elements are read. It answers the queries made by the readers of elements
+as if edits had been applied, but only records them. Once all elements are read, `Plan.apply` fuses the edits into one
+`drop_vars`, one `rename` and one `assign` applied to the original dataset.
+
+Plans are printed to standard error before being applied if the `XNCML_DEBUG_PLAN` environment variable is set.
+"""
+
+from __future__ import annotations
+import os
+import sys
+from typing import TYPE_CHECKING
+
+import numpy as np
+import xarray as xr
+
+
+if TYPE_CHECKING:
+    from collections.abc import Hashable, Iterable, Mapping
+
+
+def _rename_dims(var: xr.Variable, mapping: Mapping[str, str]) -> xr.Variable:
+    """Return variable with dimensions renamed, sharing the data of `var`."""
+    if not any(dim in mapping for dim in var.dims):
+        return var
+    out = var.to_base_variable()
+    out.dims = tuple(mapping.get(dim, dim) for dim in var.dims)
+    return out
+
+
+class Plan:
+    """
+    Edits of a dataset, collected while reading NcML elements and applied at once.
+
+    The methods of the plan used by the readers of NcML elements mimic those of `xarray.Dataset`, but return the plan
+    itself instead of a new dataset. Variables are returned as `xarray.Variable` objects.
+
+    Parameters
+    ----------
+    ds : xr.Dataset
+      Dataset to be edited.
+    """
+
+    def __init__(self, ds: xr.Dataset):
+        self.steps = []
+        self._reset(ds)
+
+    def _reset(self, ds: xr.Dataset):
+        self._ds = ds
+        # Content of each variable, by current name: the name of a variable of `ds`, or a new variable.
+        self._entries: dict[Hashable, Hashable | xr.Variable] = {name: name for name in ds.variables}
+        # Current name of the dimensions of `ds`.
+        self._dims: dict[Hashable, Hashable] = {dim: dim for dim in ds.dims}
+        # Dimensions of new variables.
+        self._new_dims: set[Hashable] = set()
+        self.attrs = dict(ds.attrs)
+
+    def __contains__(self, name: Hashable) -> bool:
+        """Return whether variable is in the dataset."""
+        return name in self._entries
+
+    def __getitem__(self, name: Hashable) -> xr.Variable:
+        """Return variable, with its dimensions renamed, or the positions along a dimension without coordinate."""
+        if name not in self._entries:
+            if name in self._dims.values() or name in self._new_dims:
+                # Dimensions without coordinate are virtual variables of `xr.Dataset`.
+                return xr.Variable(name, np.arange(self.dims[name]))
+            raise KeyError(name)
+        entry = self._entries[name]
+        if isinstance(entry, xr.Variable):
+            return entry
+        return _rename_dims(self._ds.variables[entry], self._dims)
+
+    def __setitem__(self, name: Hashable, var: xr.Variable):
+        """Add or replace variable."""
+        self._entries[name] = var
+        self._new_dims.update(var.dims)
+        self.steps.append(f"set {name!r} {var.dims}")
+
+    def get(self, name: Hashable, default=None) -> xr.Variable | None:
+        """Return variable, or `default` if not found."""
+        try:
+            return self[name]
+        except KeyError:
+            return default
+
+    @property
+    def dims(self) -> dict[Hashable, int]:
+        """Return dimension sizes of variables, by dimension name."""
+        out = {}
+        for name in self._entries:
+            out.update(self[name].sizes)
+        return out
+
+    def rename(self, mapping: Mapping[Hashable, Hashable]) -> Plan:
+        """Rename variables, and dimensions of the same name, as `xr.Dataset.rename`."""
+        dims = set(self._dims.values()) | self._new_dims
+        for old, new in mapping.items():
+            if old not in self._entries and old not in dims:
+                raise ValueError(f"cannot rename {old!r} because it is not a variable or dimension in this dataset")
+            if old in self._entries:
+                if new in self._entries and new != old:
+                    raise ValueError(f"the new name {new!r} conflicts")
+                self._entries[new] = self._entries.pop(old)
+                self.steps.append(f"rename variable {old!r} to {new!r}")
+        self.rename_dims({old: new for old, new in mapping.items() if old in dims})
+        return self
+
+    def rename_dims(self, mapping: Mapping[Hashable, Hashable]) -> Plan:
+        """Rename dimensions, as `xr.Dataset.rename_dims`."""
+        if not mapping:
+            return self
+        for dim, current in self._dims.items():
+            self._dims[dim] = mapping.get(current, current)
+        self._new_dims = {mapping.get(dim, dim) for dim in self._new_dims}
+        for name, entry in self._entries.items():
+            if isinstance(entry, xr.Variable):
+                self._entries[name] = _rename_dims(entry, mapping)
+        self.steps.append(f"rename dimensions {dict(mapping)}")
+        return self
+
+    def drop_vars(self, names: Hashable | Iterable[Hashable], errors: str = "raise") -> Plan:
+        """Remove variables, as `xr.Dataset.drop_vars`."""
+        names = [names] if isinstance(names, str) else list(names)
+        if errors == "raise" and (missing := [name for name in names if name not in self._entries]):
+            raise ValueError(f"These variables cannot be found in this dataset: {missing}")
+        for name in names:
+            if self._entries.pop(name, None) is not None:
+                self.steps.append(f"drop variable {name!r}")
+        return self
+
+    def drop_dims(self, names: Hashable | Iterable[Hashable]) -> Plan:
+        """Remove dimensions and the variables along them, as `xr.Dataset.drop_dims`."""
+        self.flush()
+        self._reset(self._ds.drop_dims(names))
+        self.steps.append(f"drop dimensions {names!r}")
+        return self
+
+    def expand_dims(self, dims: Mapping[Hashable, int]) -> Plan:
+        """Add dimensions to data variables, as `xr.Dataset.expand_dims`."""
+        self.flush()
+        self._reset(self._ds.expand_dims(dims))
+        self.steps.append(f"expand dimensions {dict(dims)}")
+        return self
+
+    def fused(self) -> dict:
+        """
+        Return the edits of the dataset, fused into one operation of each kind, in the order they are applied.
+
+        Returns
+        -------
+        dict
+          Arguments of `drop_vars`, `rename`, `rename_vars`, `rename_dims` and `assign`, and new attributes of the
+          dataset.
+        """
+        kept = {entry for entry in self._entries.values() if not isinstance(entry, xr.Variable)}
+        assign = {name: entry for name, entry in self._entries.items() if isinstance(entry, xr.Variable)}
+        # Variables replaced by a new one of the same name are not dropped, so that they stay coordinates if they were.
+        drop = [name for name in self._ds.variables if name not in kept and name not in assign]
+
+        dims = {dim for name in kept for dim in self._ds.variables[name].dims}
+        rename_vars = {entry: name for name, entry in self._entries.items() if not isinstance(entry, xr.Variable) and entry != name}
+        rename_dims = {dim: name for dim, name in self._dims.items() if dim != name and dim in dims}
+        # Variables and dimensions sharing the same name and new name are renamed together, which keeps indexes.
+        rename = {old: new for old, new in rename_vars.items() if rename_dims.get(old) == new}
+        return {
+            "drop_vars": drop,
+            "rename": rename,
+            "rename_vars": {old: new for old, new in rename_vars.items() if old not in rename},
+            "rename_dims": {old: new for old, new in rename_dims.items() if old not in rename},
+            "assign": assign,
+            "attrs": self.attrs,
+        }
+
+    def flush(self):
+        """Apply the edits collected so far, and collect further edits against the result."""
+        steps = self.steps
+        self._reset(self.apply())
+        self.steps = steps
+
+    def apply(self) -> xr.Dataset:
+        """
+        Return the dataset with all edits applied.
+
+        Returns
+        -------
+        xr.Dataset
+          Edited dataset. Variables that were not edited share their data with those of the original dataset.
+        """
+        if os.environ.get("XNCML_DEBUG_PLAN"):
+            print(self, file=sys.stderr)
+
+        fused = self.fused()
+        ds = self._ds
+        if fused["drop_vars"]:
+            ds = ds.drop_vars(fused["drop_vars"])
+        if fused["rename"]:
+            ds = ds.rename(fused["rename"])
+        if fused["rename_vars"]:
+            ds = ds.rename_vars(fused["rename_vars"])
+        if fused["rename_dims"]:
+            ds = ds.rename_dims(fused["rename_dims"])
+        if fused["assign"]:
+            ds = ds.assign(fused["assign"])
+        ds.attrs = fused["attrs"]
+        if ds is not self._ds:
+            # Files opened for the original dataset are closed with the edited one.
+            ds.set_close(self._ds.close)
+        return ds
+
+    def __repr__(self) -> str:
+        """Return edits collected, and their fused form."""
+        fused = self.fused()
+        lines = [f"<xncml.Plan: {len(self.steps)} edits of a dataset with {len(self._ds.variables)} variables>"]
+        lines.extend(f"  {i}. {step}" for i, step in enumerate(self.steps, start=1))
+        lines.append("Fused:")
+        lines.extend(f"  {key}: {fused[key]}" for key in ("drop_vars", "rename", "rename_vars", "rename_dims") if fused[key])
+        if fused["assign"]:
+            lines.append(f"  assign: {list(fused['assign'])}")
+        if fused["attrs"] != self._ds.attrs:
+            lines.append(f"  attrs: {len(fused['attrs'])} attributes")
+        return "\n".join(lines)
@@ -0,0 +1,278 @@
+"""
+# Directory scans
+
+Helpers for the <scan> element of aggregations. Directories are walked with `os.scandir`, which returns the file type
+of each entry without extra system calls, so that directories and other non-file entries are discarded as soon as they
+are listed, and file names are matched while walking rather than after the whole tree has been listed. Subdirectories can
+be scanned concurrently by a thread pool.
+
+Durations, used by the `recheckEvery` attribute of aggregations and the `olderThan` attribute of scans, are parsed by
+`parse_duration`, and the dates embedded in file names by `dateFormatMark` are read by `dates_from_names`.
+"""
+
+from __future__ import annotations
+import datetime as dt
+import fnmatch
+import os
+import re
+from concurrent.futures import FIRST_COMPLETED, Executor, ThreadPoolExecutor, wait
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+import numpy as np
+
+
+if TYPE_CHECKING:
+    from collections.abc import Callable, Sequence
+
+
+def matcher(reg_exp: str | None = None, suffix: str | None = None) -> Callable[[str], bool] | None:
+    """
+    Return function telling whether a file path is selected by a <scan> element.
+
+    Parameters
+    ----------
+    reg_exp : str, optional
+      Regular expression matched against the beginning of the full path of files.
+    suffix : str, optional
+      Suffix of selected files. Ignored if `reg_exp` is given.
+
+    Returns
+    -------
+    Callable or None
+      Function called with the path of a file, or None if all files are selected.
+    """
+    if reg_exp:
+        return re.compile(reg_exp).match
+    if suffix:
+        pat = re.compile(fnmatch.translate(os.path.normcase("*" + suffix)))
+        return lambda path: pat.match(os.path.normcase(path)) is not None
+    return None
+
+
+def _scan_dir(
+    path: str, subdirs: bool, match: Callable[[str], bool] | None, modified_before: float | None = None
+) -> tuple[list[os.DirEntry], list[str], int]:
+    """Return files matching in directory, subdirectories to be scanned, and number of files listed."""
+    files = []
+    dirs = []
+    count = 0
+    with os.scandir(path) as it:
+        for entry in it:
+            if entry.is_dir(follow_symlinks=False):
+                if subdirs:
+                    dirs.append(entry.path)
+            elif entry.is_file():
+                count += 1
+                if match is None or match(entry.path):
+                    # The stat result is cached by the entry, for later use by the caller.
+                    if modified_before is None or entry.stat().st_mtime < modified_before:
+                        files.append(entry)
+    return files, dirs, count
+
+
+def walk(
+    root: str | Path,
+    subdirs: bool = True,
+    match: Callable[[str], bool] | None = None,
+    parallel: int | Executor | None = None,
+    modified_before: float | None = None,
+) -> tuple[list[os.DirEntry], int]:
+    """
+    Return files found under `root` matching the given filter, sorted by path.
+
+    Parameters
+    ----------
+    root : str | Path
+      Directory to scan.
+    subdirs : bool
+      Whether to scan subdirectories. Symbolic links to directories are not followed.
+    match : Callable, optional
+      Function called with the path of each file, returning whether it is selected.
+    parallel : int | Executor, optional
+      Number of threads, or executor, used to scan subdirectories concurrently.
+    modified_before : float, optional
+      Timestamp, in seconds since the epoch, before which selected files must have been last modified. Files are only
+      stat'ed if they match.
+
+    Returns
+    -------
+    list of os.DirEntry
+      Selected files. Their `stat` results are cached by `os.DirEntry` once fetched.
+    int
+      Number of files found, selected or not.
+    """
+    root = str(Path(root))
+    if parallel is None:
+        out, count, pending = [], 0, [root]
+        while pending:
+            files, dirs, n = _scan_dir(pending.pop(), subdirs, match, modified_before)
+            out.extend(files)
+            pending.extend(dirs)
+            count += n
+    else:
+        executor = parallel if isinstance(parallel, Executor) else ThreadPoolExecutor(max_workers=parallel)
+        try:
+            out, count = _walk_concurrently(executor, root, subdirs, match, modified_before)
+        finally:
+            if executor is not parallel:
+                executor.shutdown()
+
+    out.sort(key=lambda entry: entry.path)
+    return out, count
+
+
+def _walk_concurrently(
+    executor: Executor, root: str, subdirs: bool, match: Callable[[str], bool] | None, modified_before: float | None
+) -> tuple[list[os.DirEntry], int]:
+    # Directories are submitted from this thread as their parent's scan completes, so that tasks never wait on each other.
+    out, count = [], 0
+    pending = {executor.submit(_scan_dir, root, subdirs, match, modified_before)}
+    try:
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                files, dirs, n = future.result()
+                out.extend(files)
+                count += n
+                pending.update(executor.submit(_scan_dir, d, subdirs, match, modified_before) for d in dirs)
+    finally:
+        for future in pending:
+            future.cancel()
+    return out, count
+
+
+# Time units accepted in durations, such as the `recheckEvery` attribute of <aggregation>.
+_DURATION_UNITS = {
+    "s": "seconds",
+    "sec": "seconds",
+    "secs": "seconds",
+    "second": "seconds",
+    "seconds": "seconds",
+    "min": "minutes",
+    "mins": "minutes",
+    "minute": "minutes",
+    "minutes": "minutes",
+    "h": "hours",
+    "hr": "hours",
+    "hrs": "hours",
+    "hour": "hours",
+    "hours": "hours",
+    "d": "days",
+    "day": "days",
+    "days": "days",
+    "week": "weeks",
+    "weeks": "weeks",
+}
+
+
+def parse_duration(text: str) -> dt.timedelta:
+    """
+    Return duration given as a number followed by a time unit, such as "15 min".
+
+    Parameters
+    ----------
+    text : str
+      Duration, with units among seconds, minutes, hours, days and weeks, possibly abbreviated.
+
+    Returns
+    -------
+    dt.timedelta
+      Duration.
+    """
+    match = re.fullmatch(r"\s*(\d+(?:\.\d*)?|\.\d+)\s*([a-zA-Z]+)\s*", text)
+    if match is None or match.group(2).lower() not in _DURATION_UNITS:
+        raise ValueError(f"Invalid duration: {text!r}.")
+    value, unit = match.groups()
+    return dt.timedelta(**{_DURATION_UNITS[unit.lower()]: float(value)})
+
+
+# Fields of Java's SimpleDateFormat patterns supported by the `dateFormatMark` attribute of scans, by pattern letter.
+_DATE_FIELDS = {
+    "y": "year",
+    "M": "month",
+    "d": "day",
+    "D": "doy",
+    "H": "hour",
+    "m": "minute",
+    "s": "second",
+    "S": "millisecond",
+}
+
+
+def _date_regex(pattern: str) -> str:
+    """Return regular expression capturing the fields of a SimpleDateFormat pattern."""
+    out = []
+    for token in re.finditer(r"'([^']*)'|([a-zA-Z])\2*|.", pattern, flags=re.DOTALL):
+        quoted, letter = token.groups()
+        if quoted is not None:
+            out.append(re.escape(quoted or "'"))
+        elif letter is not None:
+            # Month names, such as `MMM`, are not supported.
+            if letter not in _DATE_FIELDS or (letter == "M" and len(token.group()) > 2):
+                raise ValueError(f"Unsupported date format field `{token.group()}` in {pattern!r}.")
+            out.append(f"(?P<{_DATE_FIELDS[letter]}>\\d{{{len(token.group())}}})")
+        else:
+            out.append(re.escape(token.group()))
+    return "".join(out)
+
+
+def dates_from_names(names: Sequence[str], date_format_mark: str) -> np.ndarray:
+    """
+    Return the dates embedded in file names, as described by a `dateFormatMark` attribute.
+
+    The mark is made of the text preceding the date in file names, followed by `#` and a Java SimpleDateFormat
+    pattern, for example `CG#yyyyDDD_HHmmss`. All names are matched in one pass, and dates are computed from the
+    fields as arrays.
+
+    Parameters
+    ----------
+    names : sequence of str
+      File names, or paths whose last component is the file name.
+    date_format_mark : str
+      Date format mark.
+
+    Returns
+    -------
+    np.ndarray
+      Dates, as datetime64 values.
+    """
+    prefix, sep, pattern = date_format_mark.partition("#")
+    if not sep:
+        prefix, pattern = "", date_format_mark
+
+    names = [Path(name).name for name in names]
+    if not names:
+        return np.array([], dtype="datetime64[ns]")
+
+    regex = re.compile(f"^(?:.*?{re.escape(prefix)}{_date_regex(pattern)})?.*$", flags=re.MULTILINE)
+    matches = list(regex.finditer("\n".join(names)))
+    fields = list(regex.groupindex)
+    if "year" not in fields:
+        raise ValueError(f"Date format mark {date_format_mark!r} has no year.")
+
+    values = {}
+    for field in fields:
+        column = [m.group(field) for m in matches]
+        if None in column:
+            raise ValueError(f"File name {names[column.index(None)]!r} does not match date format mark {date_format_mark!r}.")
+        values[field] = np.array(column, dtype=int)
+
+    year = values["year"]
+    if len(matches[0].group("year")) == 2:
+        # Two-digit years are within 80 years before and 20 years after the current year, as in Java.
+        pivot = dt.date.today().year - 80
+        year = year + pivot // 100 * 100
+        year = np.where(year < pivot, year + 100, year)
+
+    dates = (year - 1970).astype("datetime64[Y]")
+    if "doy" in values:
+        dates = dates.astype("datetime64[D]") + (values["doy"] - 1)
+    else:
+        dates = dates.astype("datetime64[M]") + (values.get("month", 1) - 1)
+        dates = dates.astype("datetime64[D]") + (values.get("day", 1) - 1)
+    dates = dates.astype("datetime64[ns]")
+    for field, unit in [("hour", "h"), ("minute", "m"), ("second", "s"), ("millisecond", "ms")]:
+        if field in values:
+            dates = dates + values[field].astype(f"timedelta64[{unit}]")
+    return dates
@@ -0,0 +1,317 @@
+import json
+import os
+from pathlib import Path
+
+import dask.array as da
+import numpy as np
+import pytest
+import xarray as xr
+
+import xncml
+from xncml.aggregation import Manifest, Member, MemberArray, MemberIndex, member_dataset, probe, probe_members
+
+
+data = Path(__file__).parent / "data"
+
+
+@pytest.fixture
+def reads(monkeypatch):
+    """Record the files read by lazy members."""
+    calls = []
+    getitem = MemberArray.__getitem__
+
+    def record(self, key):
+        calls.append(Path(self.location).name)
+        return getitem(self, key)
+
+    monkeypatch.setattr(MemberArray, "__getitem__", record)
+    return calls
+
+
+def test_probe():
+    member = probe(data / "nc" / "jan.nc", "time")
+    assert member.size == 31
+    np.testing.assert_array_equal(member.coords, np.arange(31))
+
+    with pytest.raises(ValueError, match="Dimension `x` not found"):
+        probe(data / "nc" / "jan.nc", "x")
+
+
+def test_probe_members_parallel():
+    from concurrent.futures import ThreadPoolExecutor
+
+    fns = [data / "nc" / "jan.nc", data / "nc" / "feb.nc"]
+    with ThreadPoolExecutor(2) as executor:
+        members = probe_members(fns, "time", parallel=executor)
+    assert [m.size for m in members] == [31, 28]
+
+
+def test_member_dataset(reads):
+    with xr.open_dataset(data / "nc" / "jan.nc", decode_times=False) as template:
+        ds = member_dataset(template, probe(data / "nc" / "feb.nc", "time"), "time")
+        assert ds.sizes["time"] == 28
+        assert isinstance(ds.T.data, da.Array)
+        xr.testing.assert_identical(ds.lat, template.lat)
+        assert not reads
+
+        with xr.open_dataset(data / "nc" / "feb.nc", decode_times=False) as feb:
+            xr.testing.assert_identical(ds.T.load(), feb.T.load())
+        assert reads == ["feb.nc"]
+
+
+def test_member_dataset_opens_file_once(monkeypatch):
+    from xncml import parser
+
+    opened = []
+    open_dataset = parser._open_dataset
+
+    def record(location, **kwargs):
+        opened.append(Path(location).name)
+        return open_dataset(location, **kwargs)
+
+    monkeypatch.setattr(parser, "_open_dataset", record)
+    with xr.open_dataset(data / "nc" / "jan.nc", decode_times=False) as template:
+        ds = member_dataset(template, probe(data / "nc" / "feb.nc", "time"), "time", chunks={"time": 5})
+        assert ds.T.data.npartitions == 6
+        with xr.open_dataset(data / "nc" / "feb.nc", decode_times=False) as feb:
+            xr.testing.assert_identical(ds.load(), feb.load())
+        ds.close()
+    assert opened == ["feb.nc"]
+
+
+@pytest.mark.parametrize(
+    "fn",
+    [
+        "aggExisting.xml",
+        "aggExisting1.xml",
+        "aggExisting2.xml",
+        "aggExistingWcoords.xml",
+        "aggExistingAddCoord.ncml",
+        "nested/TestNestedDirs.ncml",
+    ],
+)
+def test_lazy_members(fn):
+    with xncml.open_ncml(data / fn) as expected, xncml.open_ncml(data / fn, lazy_members=True) as ds:
+        xr.testing.assert_identical(ds.load(), expected.load())
+
+
+def test_lazy_members_read_on_compute(reads):
+    with xncml.open_ncml(data / "aggExisting.xml", lazy_members=True) as ds:
+        assert ds.sizes["time"] == 59
+        assert isinstance(ds.T.data, da.Array)
+        assert not reads
+
+        ds.T.isel(time=40).load()
+        assert reads == ["feb.nc"]
+
+
+def test_lazy_members_annotated(monkeypatch, reads):
+    # Members declaring `ncoords` and `coordValue` are neither probed nor read until their data is computed.
+    def fail(*args):
+        raise AssertionError("Member was probed.")
+
+    monkeypatch.setattr("xncml.aggregation.probe", fail)
+    with xncml.open_ncml(data / "aggExisting2.xml", lazy_members=True) as ds:
+        assert ds.sizes["time"] == 3
+        np.testing.assert_array_equal(ds.time, [12, 13, 14])
+        assert not reads
+
+        ds.CGusfc.isel(time=-1).load()
+        assert reads == ["CG2006158_140000h_usfc.nc"]
+
+
+def test_lazy_members_annotated_mismatch():
+    text = f"""<netcdf xmlns="http://www.unidata.ucar.edu/namespaces/netcdf/ncml-2.2">
+      <aggregation dimName="time" type="joinExisting">
+        <netcdf location="{data / "nc" / "jan.nc"}" ncoords="31" coordValue="{" ".join(map(str, range(31)))}"/>
+        <netcdf location="{data / "nc" / "feb.nc"}" ncoords="28" coordValue="31 32 33"/>
+      </aggregation>
+    </netcdf>"""
+    with pytest.raises(ValueError, match=r"feb\.nc declares ncoords=28 but 3 values"):
+        xncml.open_ncml(text, lazy_members=True)
+
+
+@pytest.fixture
+def probes(monkeypatch):
+    """Record the files probed."""
+    from xncml import aggregation
+
+    calls = []
+    func = aggregation.probe
+
+    def record(location, dim_name):
+        calls.append(Path(location).name)
+        return func(location, dim_name)
+
+    monkeypatch.setattr(aggregation, "probe", record)
+    return calls
+
+
+def test_manifest(tmp_path, probes):
+    manifest = Manifest(tmp_path / "manifest.json")
+    fns = [data / "nc" / "jan.nc", data / "nc" / "feb.nc"]
+    first = manifest.probe_members(fns, "time")
+    manifest.save()
+    assert probes == ["jan.nc", "feb.nc"]
+
+    manifest = Manifest(tmp_path / "manifest.json")
+    members = manifest.probe_members(fns, "time")
+    assert probes == ["jan.nc", "feb.nc"]
+    assert manifest.probed == 0
+    for a, b in zip(first, members, strict=True):
+        assert (a.location, a.size) == (b.location, b.size)
+        np.testing.assert_array_equal(a.coords, b.coords)
+        assert a.coords.dtype == b.coords.dtype
+
+
+def test_manifest_save(tmp_path):
+    import shutil
+
+    for fn in ["jan.nc", "feb.nc", "mar.nc"]:
+        shutil.copy(data / "nc" / "jan.nc", tmp_path / fn)
+    fns = [str(tmp_path / fn) for fn in ["jan.nc", "feb.nc", "mar.nc"]]
+
+    # Concurrent saves keep each other's entries.
+    first, second = Manifest(tmp_path / "manifest.json"), Manifest(tmp_path / "manifest.json")
+    first.probe_members(fns[:1], "time")
+    second.probe_members(fns[1:2], "time")
+    first.save()
+    second.save()
+    assert set(json.loads((tmp_path / "manifest.json").read_text())["entries"]["time"]) == set(fns[:2])
+
+    # Entries of files that no longer exist are dropped.
+    Path(fns[1]).unlink()
+    manifest = Manifest(tmp_path / "manifest.json")
+    manifest.probe_members([fns[0], fns[2]], "time")
+    manifest.save()
+    assert set(json.loads((tmp_path / "manifest.json").read_text())["entries"]["time"]) == {fns[0], fns[2]}
+
+
+def test_manifest_bytes_coords(tmp_path, monkeypatch):
+    from xncml import aggregation
+
+    def probe(location, dim_name):
+        return Member(location, 1, np.array([b"a"]))
+
+    monkeypatch.setattr(aggregation, "probe", probe)
+    fns = [data / "nc" / "jan.nc"]
+    manifest = Manifest(tmp_path / "manifest.json")
+    (member,) = manifest.probe_members(fns, "time")
+    manifest.save()
+    assert member.coords.tolist() == [b"a"]
+    assert not (tmp_path / "manifest.json").exists()
+    assert Manifest(tmp_path / "manifest.json").probe_members(fns, "time")[0].coords.tolist() == [b"a"]
+
+
+def test_open_ncml_manifest(tmp_path, probes):
+    import shutil
+
+    for fn in ["jan.nc", "feb.nc"]:
+        shutil.copy(data / "nc" / fn, tmp_path / fn)
+    ncml = tmp_path / "agg.ncml"
+    ncml.write_text((data / "aggExisting.xml").read_text().replace("nc/", ""))
+    cache = tmp_path / "cache"
+
+    with xncml.open_ncml(ncml, lazy_members=True, manifest=cache) as expected:
+        expected.load()
+    assert len(list(cache.glob("manifests/*.json"))) == 1
+
+    with xncml.open_ncml(ncml, lazy_members=True, manifest=cache) as ds:
+        xr.testing.assert_identical(ds.load(), expected)
+    assert probes == ["jan.nc", "feb.nc"]
+
+    # Modified files are probed again.
+    st = (tmp_path / "feb.nc").stat()
+    os.utime(tmp_path / "feb.nc", ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+    with xncml.open_ncml(ncml, lazy_members=True, manifest=cache):
+        pass
+    assert probes == ["jan.nc", "feb.nc", "feb.nc"]
+
+    with pytest.raises(ValueError, match="requires `lazy_members=True`"):
+        xncml.open_ncml(ncml, manifest=cache)
+
+
+def test_scan_manifest(tmp_path, probes):
+    fn = data / "nested" / "TestNestedDirs.ncml"
+    for _ in range(2):
+        with xncml.open_ncml(fn, lazy_members=True, manifest=tmp_path) as ds:
+            assert ds.sizes["time"] == 3
+    assert len(probes) == 3
+
+
+def test_aggregated_dataset_refresh(tmp_path, probes):
+    import shutil
+
+    import psutil
+
+    ncml = tmp_path / "agg.ncml"
+    ncml.write_text(
+        """<?xml version="1.0" encoding="UTF-8"?>
+<netcdf xmlns="http://www.unidata.ucar.edu/namespaces/netcdf/ncml-2.2">
+  <aggregation dimName="time" type="joinExisting" recheckEvery="15 min">
+    <scan location="." suffix=".nc"/>
+  </aggregation>
+</netcdf>
+"""
+    )
+    shutil.copy(data / "nc" / "jan.nc", tmp_path / "jan.nc")
+    proc = psutil.Process()
+    before = len(proc.open_files())
+
+    with xncml.AggregatedDataset(ncml) as agg:
+        assert agg.recheck_every.total_seconds() == 900
+        assert agg.dataset.sizes["time"] == 31
+        assert not agg.refresh()
+
+        # New files are probed and appended.
+        shutil.copy(data / "nc" / "feb.nc", tmp_path / "jan_feb.nc")
+        assert agg.refresh(force=True)
+        assert agg.dataset.sizes["time"] == 59
+        assert probes == ["jan.nc", "jan_feb.nc"]
+        assert agg.dataset.encoding["member_index"].locate(40) == (str(tmp_path / "jan_feb.nc"), 9)
+        with xncml.open_ncml(ncml) as expected:
+            xr.testing.assert_identical(agg.dataset.load(), expected.load())
+
+        # Removed files trigger a new read.
+        (tmp_path / "jan.nc").unlink()
+        assert agg.refresh(force=True)
+        assert agg.dataset.sizes["time"] == 28
+        assert probes[-1] == "jan_feb.nc"
+
+    assert len(proc.open_files()) == before
+
+
+def test_lazy_members_selection(monkeypatch, reads):
+    # Members outside the selection are neither probed nor read.
+    def fail(*args):
+        raise AssertionError("Member was probed.")
+
+    monkeypatch.setattr("xncml.aggregation.probe", fail)
+    with xncml.open_ncml(data / "aggExisting2.xml", lazy_members=True, sel={"time": 13}) as ds:
+        ds.CGusfc.load()
+        assert reads == ["CG2006158_130000h_usfc.nc"]
+        assert "time" not in ds.CGusfc.dims
+
+
+def test_member_index():
+    index = MemberIndex(["a.nc", "b.nc", "c.nc"], [3, 0, 2], np.array([0, 1, 2, 5, 6]))
+    np.testing.assert_array_equal(index.offsets, [0, 3, 3])
+    assert index.locate(1) == ("a.nc", 1)
+    assert index.locate(5.5) == ("c.nc", 0)
+    with pytest.raises(KeyError):
+        index.locate(3)
+
+    assert index.members_for(slice(2, 5)) == ["a.nc", "c.nc"]
+    assert index.members_for(slice(3, 4)) == []
+    assert index.members_for(slice(None, 0)) == ["a.nc"]
+    assert index.members_for(slice(6, None)) == ["c.nc"]
+
+
+@pytest.mark.parametrize("lazy_members", [False, True])
+def test_open_ncml_member_index(lazy_members):
+    with xncml.open_ncml(data / "aggExisting.xml", lazy_members=lazy_members) as ds:
+        index = ds.encoding["member_index"]
+        location, position = index.locate(40)
+        assert Path(location).name == "feb.nc"
+        assert position == 9
+        assert [Path(loc).name for loc in index.members_for(slice(30, 31))] == ["jan.nc", "feb.nc"]
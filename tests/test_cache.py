@@ -0,0 +1,85 @@
+import os
+import shutil
+from pathlib import Path
+
+import pytest
+
+import xncml
+from xncml.cache import ParseCache, parse_cache, user_cache_dir
+from xncml.parser import parse
+
+
+data = Path(__file__).parent / "data"
+
+
+@pytest.fixture
+def cache():
+    return ParseCache(maxsize=4)
+
+
+def test_hit_and_miss(cache):
+    calls = []
+
+    def loader(path):
+        calls.append(path)
+        return parse(path, cache=False)
+
+    a = cache.get(data / "testRead.xml", loader)
+    b = cache.get(data / "testRead.xml", loader)
+    assert len(calls) == 1
+    assert a == b
+    assert a is not b
+    info = cache.cache_info()
+    assert (info.hits, info.misses, info.currsize) == (1, 1, 1)
+    assert info.nbytes > 0
+
+
+def test_invalidation(cache, tmp_path):
+    fn = tmp_path / "doc.ncml"
+    shutil.copy(data / "testRead.xml", fn)
+    first = cache.get(fn, parse)
+    text = fn.read_text().replace("Example Data", "Changed Data")
+    fn.write_text(text)
+    st = fn.stat()
+    os.utime(fn, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+    second = cache.get(fn, parse)
+    assert first != second
+    assert cache.cache_info().misses == 2
+    assert len(cache) == 1
+
+
+def test_lru_eviction(cache):
+    files = sorted(data.glob("agg*.xml"))[:6]
+    for fn in files:
+        cache.get(fn, parse)
+    assert len(cache) == 4
+    # The oldest entries are evicted first.
+    cache.get(files[0], parse)
+    assert cache.cache_info().misses == 7
+
+    cache.resize(maxbytes=0)
+    assert len(cache) == 0
+
+
+def test_clear(cache):
+    cache.get(data / "testRead.xml", parse)
+    cache.clear()
+    assert cache.cache_info() == (0, 0, 4, 0, cache.maxbytes, 0)
+
+
+def test_cached_model_is_not_corrupted():
+    parse_cache.clear()
+    fn = data / "testGroupConflictingDims.xml"
+    xncml.open_ncml(fn, group="*")
+    obj = parse(fn)
+    obj.choice.clear()
+    ds = xncml.open_ncml(fn, group="*")
+    assert ds.sizes["index__1"] == 94
+    assert parse_cache.cache_info().hits == 2
+
+
+def test_user_cache_dir(monkeypatch, tmp_path):
+    monkeypatch.setenv("XNCML_CACHE_DIR", str(tmp_path))
+    assert user_cache_dir() == tmp_path
+    monkeypatch.delenv("XNCML_CACHE_DIR")
+    assert user_cache_dir().name == "xncml"
@@ -0,0 +1,121 @@
+import gc
+import io
+import tracemalloc
+import weakref
+from pathlib import Path
+
+import pytest
+from xsdata.formats.dataclass.parsers import XmlParser
+
+import xncml
+from xncml import fastparse
+from xncml.generated import Aggregation, Netcdf
+from xncml.parser import parse
+
+
+data = Path(__file__).parent / "data"
+NS = "http://www.unidata.ucar.edu/namespaces/netcdf/ncml-2.2"
+
+ncml_files = sorted(p.relative_to(data) for ext in ("*.xml", "*.ncml") for p in data.rglob(ext))
+
+
+@pytest.mark.parametrize("fn", ncml_files, ids=str)
+def test_same_model_as_xsdata(fn):
+    try:
+        expected = XmlParser().from_bytes((data / fn).read_bytes(), Netcdf)
+    except Exception:
+        pytest.skip("Document rejected by xsdata.")
+    assert fastparse.parse(data / fn) == expected
+
+
+def test_mixed_content():
+    xml = b"""<netcdf xmlns="http://www.unidata.ucar.edu/namespaces/netcdf/ncml-2.2">
+      <enumTypedef name="e"> pre <enum key="1">a</enum> mid <enum key="2"> b </enum>
+      </enumTypedef>
+      <attribute name="x"> hello <b>x</b> tail </attribute>
+    </netcdf>"""
+    assert fastparse.parse(io.BytesIO(xml)) == XmlParser().from_bytes(xml, Netcdf)
+
+
+def test_unknown_element():
+    xml = b'<netcdf xmlns="http://www.unidata.ucar.edu/namespaces/netcdf/ncml-2.2"><foo/></netcdf>'
+    with pytest.raises(ValueError, match="Unknown property"):
+        fastparse.parse(io.BytesIO(xml))
+
+
+def test_parse_engine():
+    fn = data / "aggExisting.xml"
+    assert parse(fn, cache=False, engine="fast") == parse(fn, cache=False)
+    with pytest.raises(ValueError, match="Unknown parsing engine"):
+        parse(fn, engine="lxml")
+
+
+def test_open_ncml():
+    fn = data / "aggExisting.xml"
+    with xncml.open_ncml(fn, parse_engine="fast") as ds, xncml.open_ncml(fn) as expected:
+        assert ds.identical(expected)
+
+
+def _members(obj):
+    return [list(item.netcdf) for item in obj.choice if isinstance(item, Aggregation)]
+
+
+@pytest.mark.parametrize("fn", ["aggExisting.xml", "aggUnion.xml", "aggSynScan.xml", "aggSynRename.xml"])
+def test_stream_members(fn):
+    fn = data / fn
+    expected = parse(fn, cache=False)
+    obj = fastparse.parse(fn, stream=True)
+    assert all(isinstance(item.netcdf, fastparse.MemberStream) for item in obj.choice if isinstance(item, Aggregation))
+    assert _members(obj) == _members(expected)
+
+
+def test_stream_memory(tmp_path):
+    def peak(n):
+        members = "".join(f'<netcdf location="m{i}.nc" coordValue="{i}"><attribute name="a" value="{i}"/></netcdf>' for i in range(n))
+        fn = tmp_path / f"agg{n}.ncml"
+        fn.write_text(f'<netcdf xmlns="{NS}"><aggregation dimName="time" type="joinNew">{members}</aggregation></netcdf>')
+        tracemalloc.start()
+        obj = fastparse.parse(fn, stream=True)
+        count = sum(1 for _ in obj.choice[0].netcdf)
+        _, out = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        assert count == n
+        return out
+
+    assert peak(20_000) < 2 * peak(1_000)
+
+
+def test_open_ncml_stream():
+    fn = data / "aggExistingWcoords.xml"
+    with xncml.open_ncml(fn, parse_engine="stream") as ds, xncml.open_ncml(fn) as expected:
+        assert ds.identical(expected)
+
+
+def test_stream_members_from_bytes():
+    fn = data / "aggExisting.xml"
+    obj = fastparse.parse(fn.read_bytes(), stream=True)
+    assert _members(obj) == _members(parse(fn, cache=False))
+
+
+@pytest.mark.parametrize("lazy_members", [False, True])
+def test_open_ncml_stream_memory(monkeypatch, lazy_members):
+    # Members streamed from the document are released once read, rather than all held until the aggregation is built.
+    alive = []
+    iter_members = fastparse.iter_members
+
+    def tracked(*args, **kwargs):
+        refs = []
+        for item in iter_members(*args, **kwargs):
+            gc.collect()
+            alive.append(sum(ref() is not None for ref in refs))
+            refs.append(weakref.ref(item))
+            yield item
+
+    monkeypatch.setattr(fastparse, "iter_members", tracked)
+    members = "".join(f'<netcdf location="{data / "nc" / fn}"/>' for fn in ["jan.nc", "feb.nc"] * 10)
+    doc = f'<netcdf xmlns="{NS}"><aggregation dimName="time" type="joinExisting">{members}</aggregation></netcdf>'
+    with xncml.open_ncml(doc, parse_engine="stream", lazy_members=lazy_members) as ds:
+        assert ds.sizes["time"] == 590
+    assert len(alive) == 20
+    # The last member read may still be referenced by the frames of the last file opened.
+    assert max(alive) <= 2
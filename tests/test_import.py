@@ -0,0 +1,43 @@
+import subprocess
+import sys
+
+import pytest
+
+
+# Regression thresholds, in seconds, for the cumulative import time of the given statement.
+# They are well above the measured times but far below the time needed to import xarray.
+IMPORT_TIME_THRESHOLD = 0.1
+HEAVY_MODULES = ["dask", "numpy", "xarray", "xsdata", "xncml.generated", "xncml.parser"]
+
+
+def import_times(statement: str) -> dict[str, float]:
+    """Return cumulative import time, in seconds, of the modules imported by statement."""
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", statement], capture_output=True, text=True, check=True)  # noqa: S603
+    out = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = (field.strip() for field in line.removeprefix("import time:").split("|"))
+        out[name] = int(cumulative) * 1e-6
+    return out
+
+
+@pytest.mark.parametrize("statement", ["import xncml", "import xncml; xncml.Dataset"])
+def test_import_is_light(statement):
+    times = import_times(statement)
+    assert not set(HEAVY_MODULES).intersection(times)
+    for name in ("xncml", "xncml.core"):
+        assert times.get(name, 0) < IMPORT_TIME_THRESHOLD
+
+
+def test_lazy_objects():
+    times = import_times("import xncml; xncml.open_ncml")
+    assert "xarray" in times
+    assert "xsdata" not in times
+
+
+@pytest.mark.parametrize("name", ["aggregation", "cache", "core", "fastparse", "parser", "plan", "scan"])
+def test_lazy_submodules(name):
+    # Submodules are available as attributes of the package, without being imported explicitly.
+    code = f"import xncml; assert xncml.{name}.__name__ == 'xncml.{name}'; assert '{name}' in dir(xncml)"
+    subprocess.run([sys.executable, "-c", code], check=True)  # noqa: S603
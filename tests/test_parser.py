@@ -1,9 +1,12 @@
 import datetime as dt
+import io
+import threading
 from pathlib import Path
 
 import numpy as np
 import psutil
 import pytest
+import xarray as xr
 
 import xncml
 
@@ -283,13 +286,14 @@ def test_agg_existing_inequivalent_cals():
     assert ds.time[-1] == dt.datetime(2018, 12, 31)
 
 
-@pytest.mark.skip(reason="dateFormatMark not implemented")
 def test_aggexistingone():
-    ds = xncml.open_ncml(data / "aggExistingOne.ncml")
-    assert len(ds.time) == 3
+    with CheckClose():
+        ds = xncml.open_ncml(data / "aggExistingOne.xml")
+        assert len(ds.time) == 3
+        assert ds.time[0] == np.datetime64("2006-06-07T12:00:00")
+        ds.close()
 
 
-@pytest.mark.skip(reason="dateFormatMark not implemented")
 @pytest.mark.skip(reason="<promoteGlobalAttribute> not implemented")
 def test_agg_existing_promote():
     ds = xncml.open_ncml(data / "aggExistingPromote.ncml")
@@ -452,3 +456,458 @@ def check_read_data(ds):
     assert t.shape == (59, 3, 4)
     assert t.dtype == float
     assert "T" in ds.data_vars
+
+
+@pytest.mark.parametrize("kind", ["str", "bytes", "bytes_io", "string_io", "string_io_bom", "netcdf"])
+def test_open_in_memory(kind):
+    fn = data / "aggExisting.xml"
+    text = fn.read_text()
+    source = {
+        "str": lambda: text,
+        "bytes": lambda: text.encode(),
+        "bytes_io": lambda: io.BytesIO(text.encode()),
+        "string_io": lambda: io.StringIO(text),
+        # Content read from file-like objects is not checked for a leading "<".
+        "string_io_bom": lambda: io.StringIO("\ufeff" + text),
+        "netcdf": lambda: xncml.parser.parse(fn),
+    }[kind]()
+    with xncml.open_ncml(source, base_path=data) as ds, xncml.open_ncml(fn) as expected:
+        assert ds.identical(expected)
+
+
+def test_open_in_memory_relative_to_cwd(monkeypatch):
+    text = (data / "readMetadata.xml").read_text()
+    monkeypatch.chdir(data)
+    ds = xncml.open_ncml(text, parse_engine="stream")
+    assert ds.attrs["title"] == "Example Data"
+
+
+def test_open_base_path(tmp_path):
+    fn = tmp_path / "readMetadata.xml"
+    fn.write_text((data / "readMetadata.xml").read_text())
+    ds = xncml.open_ncml(fn, base_path=data)
+    assert ds.variables["T"].attrs["units"] == "degC"
+
+
+@pytest.mark.parametrize("fn", ["aggExisting.xml", "aggSynScan.xml", "aggUnionSimple.xml"])
+def test_parallel(fn):
+    with CheckClose():
+        with xncml.open_ncml(data / fn) as expected, xncml.open_ncml(data / fn, parallel=4) as ds:
+            assert ds.identical(expected)
+            assert list(ds.data_vars) == list(expected.data_vars)
+
+
+def test_parallel_netcdf4(tmp_path):
+    # netCDF4 and HDF5 are not thread-safe, so that files opened concurrently without a lock crash the process.
+    for i in range(40):
+        ds = xr.Dataset({"tas": (("time", "x"), np.full((3, 50), i, "f4"))}, coords={"time": np.arange(3 * i, 3 * i + 3)})
+        ds.to_netcdf(tmp_path / f"m{i:02d}.nc", format="NETCDF4", engine="netcdf4", encoding={"tas": {"zlib": True}})
+    members = "".join(f'<netcdf location="m{i:02d}.nc"/>' for i in range(40))
+    text = f"""<netcdf xmlns="http://www.unidata.ucar.edu/namespaces/netcdf/ncml-2.2">
+      <aggregation dimName="time" type="joinExisting">{members}</aggregation>
+    </netcdf>"""
+    with xncml.open_ncml(text, base_path=tmp_path) as expected, xncml.open_ncml(text, base_path=tmp_path, parallel=8) as ds:
+        assert ds.identical(expected)
+        np.testing.assert_array_equal(ds.tas.values[::3, 0], np.arange(40))
+
+
+def test_parallel_overlap(monkeypatch):
+    # Only the reading of metadata is serialized, so that the rest of the opening of members runs concurrently.
+    barrier = threading.Barrier(4, timeout=10)
+    decode = xr.conventions.decode_cf_variables
+
+    def wait(*args, **kwargs):
+        barrier.wait()
+        return decode(*args, **kwargs)
+
+    monkeypatch.setattr(xr.conventions, "decode_cf_variables", wait)
+    members = "".join(f'<netcdf location="nc/{name}"/>' for name in ["jan.nc", "feb.nc"] * 2)
+    text = f"""<netcdf xmlns="http://www.unidata.ucar.edu/namespaces/netcdf/ncml-2.2">
+      <aggregation dimName="time" type="joinExisting">{members}</aggregation>
+    </netcdf>"""
+    with xncml.open_ncml(text, base_path=data, parallel=4) as ds:
+        assert ds.sizes["time"] == 118
+
+
+def test_parallel_executor():
+    from concurrent.futures import ThreadPoolExecutor
+
+    with ThreadPoolExecutor(2) as executor:
+        ds = xncml.open_ncml(data / "aggExisting1.xml", parallel=executor)
+    assert all(ds["time"].data == list(range(7, 125, 2)))
+    ds.close()
+
+
+@pytest.mark.parametrize("parallel", [None, 3])
+def test_aggregation_member_failure_closes_files(parallel):
+    members = "".join(f'<netcdf location="nc/{name}"/>' for name in ["jan.nc", "missing.nc", "feb.nc", "jan.nc"])
+    text = f"""<netcdf xmlns="http://www.unidata.ucar.edu/namespaces/netcdf/ncml-2.2">
+      <aggregation dimName="time" type="joinExisting">{members}</aggregation>
+    </netcdf>"""
+    with CheckClose():
+        with pytest.raises(FileNotFoundError):
+            xncml.open_ncml(text, base_path=data, parallel=parallel)
+
+
+@pytest.mark.parametrize("lazy_members", [False, True])
+@pytest.mark.parametrize(
+    "chunks,expected",
+    [
+        ("file-aligned", ((28, 31), (3,), (4,))),
+        ({"time": 10, "lon": 2}, ((10, 10, 8, 10, 10, 10, 1), (3,), (2, 2))),
+        (7, ((7, 7, 7, 7, 7, 7, 7, 7, 3), (3,), (4,))),
+    ],
+)
+@pytest.mark.parametrize(
+    "members", ['<netcdf location="nc/feb.nc"/><netcdf location="nc/jan.nc"/>', r'<scan location="nc/" regExp=".*/(jan|feb)\.nc$"/>']
+)
+def test_chunks(members, chunks, expected, lazy_members):
+    # Explicit and scanned members are chunked alike, each chunk lying within a single file.
+    text = f"""<netcdf xmlns="http://www.unidata.ucar.edu/namespaces/netcdf/ncml-2.2">
+      <aggregation dimName="time" type="joinExisting">{members}</aggregation>
+    </netcdf>"""
+    with xncml.open_ncml(text, base_path=data, chunks=chunks, lazy_members=lazy_members) as ds:
+        assert ds.T.chunks == expected
+        with xncml.open_ncml(text, base_path=data) as eager:
+            assert ds.load().identical(eager.load())
+
+
+def test_chunks_auto():
+    with xncml.open_ncml(data / "aggExisting.xml", chunks="auto") as ds:
+        assert ds.T.chunks == ((31, 28), (3,), (4,))
+
+
+@pytest.fixture
+def dropped(monkeypatch):
+    """Record the variables dropped by `xr.open_dataset`, by file name."""
+    out = {}
+    open_dataset = xr.open_dataset
+
+    def spy(filename, **kwargs):
+        # netCDF4 files are opened from a store holding their path.
+        out.setdefault(Path(getattr(filename, "path", filename)).name, []).append(sorted(kwargs.get("drop_variables") or []))
+        return open_dataset(filename, **kwargs)
+
+    monkeypatch.setattr(xr, "open_dataset", spy)
+    return out
+
+
+@pytest.mark.parametrize("lazy_members", [False, True])
+@pytest.mark.parametrize(
+    "members", ['<netcdf location="nc/jan.nc"/><netcdf location="nc/feb.nc"/>', r'<scan location="nc/" regExp=".*/(jan|feb)\.nc$"/>']
+)
+def test_variable_agg_projection(dropped, members, lazy_members):
+    # Variables left out by <variableAgg> are found in the first member, and not read from the others.
+    text = f"""<netcdf xmlns="http://www.unidata.ucar.edu/namespaces/netcdf/ncml-2.2">
+      <aggregation dimName="time" type="joinExisting"><variableAgg name="T"/>{members}</aggregation>
+    </netcdf>"""
+    with CheckClose():
+        ds = xncml.open_ncml(text, base_path=data, lazy_members=lazy_members)
+        assert set(ds.variables) == {"T", "time", "lat", "lon"}
+        ds.close()
+    first, second = ("jan.nc", "feb.nc") if "netcdf" in members else ("feb.nc", "jan.nc")
+    assert dropped[first] == [[]]
+    assert dropped.get(second, [["P"]]) == [["P"]]
+
+
+@pytest.mark.parametrize("lazy_members", [False, True])
+def test_remove_variable_projection(dropped, lazy_members):
+    # Variables removed from <netcdf> are not read from any member, unless a <variable> element refers to them.
+    text = """<netcdf xmlns="http://www.unidata.ucar.edu/namespaces/netcdf/ncml-2.2">
+      <remove type="variable" name="P"/>
+      <remove type="variable" name="lat"/>
+      <variable name="lat"><attribute name="units" value="degrees_north"/></variable>
+      <aggregation dimName="time" type="joinExisting">
+        <netcdf location="nc/jan.nc"/>
+        <netcdf location="nc/feb.nc"/>
+      </aggregation>
+    </netcdf>"""
+    ds = xncml.open_ncml(text, base_path=data, lazy_members=lazy_members)
+    assert "P" not in ds.variables
+    assert ds["lat"].attrs["units"] == "degrees_north"
+    assert all(drop == ["P"] for drops in dropped.values() for drop in drops)
+
+    expected = xncml.open_ncml(data / "aggExisting.xml")
+    assert ds.T.variable.identical(expected.T.variable)
+
+
+@pytest.mark.parametrize(
+    "location,content",
+    [
+        (' location="nc/jan.nc"', ""),
+        ("", '<aggregation dimName="time" type="joinExisting"><netcdf location="nc/jan.nc"/><netcdf location="nc/feb.nc"/></aggregation>'),
+    ],
+)
+def test_remove_missing_variable(location, content):
+    # Variables left out when opening files can be removed, but removing a variable that does not exist is an error.
+    text = f"""<netcdf xmlns="http://www.unidata.ucar.edu/namespaces/netcdf/ncml-2.2"{location}>
+      <remove type="variable" name="P"/>
+      <remove type="variable" name="missing"/>
+      {content}
+    </netcdf>"""
+    with pytest.raises(ValueError, match="missing"):
+        xncml.open_ncml(text, base_path=data)
+    ds = xncml.open_ncml(text.replace('<remove type="variable" name="missing"/>', ""), base_path=data)
+    assert "P" not in ds.variables
+    assert ds.encoding["dropped_variables"] == ["P"]
+    ds.close()
+
+
+@pytest.mark.parametrize("lazy_members", [False, True])
+@pytest.mark.parametrize(
+    "isel,sel",
+    [
+        ({"time": slice(35, 40)}, None),
+        ({"time": -1}, None),
+        ({"time": [0, 40, 58]}, None),
+        ({"time": slice(None, None, 20)}, None),
+        ({"time": slice(40, 35)}, None),
+        (None, {"time": slice(10, 20)}),
+        (None, {"time": 45}),
+        ({"lat": 1}, {"time": [3, 50], "lon": -107.0}),
+    ],
+)
+def test_open_ncml_selection(isel, sel, lazy_members):
+    with xncml.open_ncml(data / "aggExisting.xml") as full:
+        expected = full.isel(isel or {}).sel(sel or {}).load()
+    with xncml.open_ncml(data / "aggExisting.xml", isel=isel, sel=sel, lazy_members=lazy_members) as ds:
+        assert ds.load().identical(expected)
+
+
+def test_open_ncml_selection_depends_on_dim():
+    # Values defined along the aggregation dimension need the whole aggregation.
+    text = """<netcdf xmlns="http://www.unidata.ucar.edu/namespaces/netcdf/ncml-2.2">
+      <variable name="time" type="int" shape="time"><values start="100" increment="1"/></variable>
+      <aggregation dimName="time" type="joinExisting">
+        <netcdf location="nc/jan.nc"/>
+        <netcdf location="nc/feb.nc"/>
+      </aggregation>
+    </netcdf>"""
+    ds = xncml.open_ncml(text, base_path=data, sel={"time": slice(130, 131)})
+    assert list(ds.time.values) == [130, 131]
+    assert ds.T.values[0, 0, 0] == 3000.0
+
+
+@pytest.mark.parametrize(
+    "fn", ["aggExisting.xml", "aggExisting1.xml", "aggExistingAddCoord.ncml", "aggNew.ncml", "aggSynScan.xml", "nested/TestNestedDirs.ncml"]
+)
+def test_compat_override(fn):
+    with xncml.open_ncml(data / fn) as expected, xncml.open_ncml(data / fn, compat="override") as ds:
+        assert ds.load().identical(expected.load())
+
+
+def test_compat_override_takes_first_member(tmp_path):
+    for i in range(2):
+        ds = xr.Dataset(
+            {"tas": (("time", "lat"), np.full((2, 3), i)), "crs": ((), i)},
+            coords={"time": [2 * i, 2 * i + 1], "lat": [0.0, 1.0, 2.0 + i / 10]},
+        )
+        ds.to_netcdf(tmp_path / f"member_{i}.nc")
+    text = """<netcdf xmlns="http://www.unidata.ucar.edu/namespaces/netcdf/ncml-2.2">
+      <aggregation dimName="time" type="joinExisting"><scan location="." suffix=".nc"/></aggregation>
+    </netcdf>"""
+    with xncml.open_ncml(text, base_path=tmp_path, compat="override") as ds:
+        assert ds.crs.dims == ()
+        assert ds.crs.item() == 0
+        np.testing.assert_array_equal(ds.lat, [0.0, 1.0, 2.0])
+        np.testing.assert_array_equal(ds.tas[:, 0], [0, 0, 1, 1])
+
+
+def test_compat_invalid():
+    with pytest.raises(ValueError, match="compat"):
+        xncml.open_ncml(data / "aggExisting.xml", compat="equals")
+
+
+def test_time_units_change_decoded_by_group(monkeypatch):
+    from xarray.coding.times import CFDatetimeCoder
+
+    calls = []
+    decode = CFDatetimeCoder.decode
+
+    def spy(self, variable, name=None):
+        calls.append(variable.attrs["units"])
+        return decode(self, variable, name=name)
+
+    monkeypatch.setattr(CFDatetimeCoder, "decode", spy)
+
+    members = "".join(
+        f"""<netcdf>
+          <dimension name="time" length="2" />
+          <variable name="time" shape="time" type="int">
+            <attribute name="units" value="days since {units}" />
+            <attribute name="calendar" value="{calendar}" />
+            <values start="{start}" increment="1" />
+          </variable>
+        </netcdf>"""
+        for units, calendar, start in [
+            ("2000-01-01", "noleap", 0),
+            ("2000-01-03", "noleap", 0),
+            ("2000-01-01", "noleap", 4),
+            ("2000-01-07", "360_day", 0),
+        ]
+    )
+    text = f"""<netcdf xmlns="http://www.unidata.ucar.edu/namespaces/netcdf/ncml-2.2">
+      <aggregation dimName="time" type="joinExisting" timeUnitsChange="true">{members}</aggregation>
+    </netcdf>"""
+    ds = xncml.open_ncml(text)
+    assert sorted(calls) == ["days since 2000-01-01", "days since 2000-01-03", "days since 2000-01-07"]
+    assert [t.day for t in ds.time.values] == list(range(1, 9))
+    assert ds.time.encoding["units"] == "days since 2000-01-01"
+
+
+@pytest.mark.parametrize(
+    "text, dtype, separator, expected",
+    [
+        ("1 2\n  3 ", np.int32, " ", [1, 2, 3]),
+        ("1.5, -2,nan", np.float32, ",", [1.5, -2, np.nan]),
+        ("4000000000 1", np.uint32, " ", [4000000000, 1]),
+        ("a b c", None, " ", ["a", "b", "c"]),
+        ("ab;c d", str, ";", ["ab", "c d"]),
+    ],
+)
+def test_decode_values(text, dtype, separator, expected):
+    from xncml.parser import decode_values
+
+    out = decode_values(text, dtype, separator)
+    assert out.dtype.kind == np.dtype(dtype or str).kind
+    np.testing.assert_array_equal(out, expected)
+
+
+@pytest.mark.parametrize("text", ["1 a", "1.5", "128"])
+def test_decode_values_invalid(text):
+    from xncml.parser import decode_values
+
+    with pytest.raises((ValueError, OverflowError)):
+        decode_values(text, np.int8)
+
+
+def test_values_range_lazy():
+    text = """<netcdf xmlns="http://www.unidata.ucar.edu/namespaces/netcdf/ncml-2.2">
+      <dimension name="lon" length="1000000" />
+      <dimension name="time" length="4" />
+      <variable name="lon" shape="lon" type="double"><values start="-180" increment="0.00036" /></variable>
+      <variable name="time" shape="time" type="int"><values start="10" increment="5" /></variable>
+      <variable name="step" shape="lon" type="float"><values start="0" increment="0.5" /></variable>
+    </netcdf>"""
+    ds = xncml.open_ncml(text)
+    assert ds.lon.attrs["group_path"] == "/"
+    assert ds.lon[-1] == pytest.approx(-180 + 999999 * 0.00036)
+    assert ds.step.chunks is not None
+    assert ds.step.dtype == np.float32
+    assert float(ds.step[3]) == 1.5
+    np.testing.assert_array_equal(ds.time, [10, 15, 20, 25])
+
+    # Dimension coordinates get a pandas index, supporting label-based selection and alignment.
+    assert ds.time.dtype == np.int32
+    assert int(ds.step.sel(lon=-180).lon) == -180
+    assert ds.sel(lon=slice(-180, -179.999)).sizes["lon"] == 3
+    np.testing.assert_array_equal(ds.sel(time=[15, 25]).time, [15, 25])
+    np.testing.assert_array_equal(ds.time.reindex(time=[5, 10]).time, [5, 10])
+    assert xncml.open_ncml(text, sel={"time": slice(15, 20)}).sizes["time"] == 2
+
+
+def test_values_range_concat():
+    member = """<netcdf>
+      <dimension name="time" length="3" />
+      <variable name="time" shape="time" type="double"><values start="{}" increment="1" /></variable>
+    </netcdf>"""
+    text = f"""<netcdf xmlns="http://www.unidata.ucar.edu/namespaces/netcdf/ncml-2.2">
+      <aggregation dimName="time" type="joinExisting">{member.format(0)}{member.format(3)}</aggregation>
+    </netcdf>"""
+    ds = xncml.open_ncml(text)
+    np.testing.assert_array_equal(ds.time, np.arange(6))
+
+
+def test_declared_variable_fill_values():
+    text = """<netcdf xmlns="http://www.unidata.ucar.edu/namespaces/netcdf/ncml-2.2">
+      <dimension name="time" length="100000" />
+      <dimension name="lat" length="1000" />
+      <variable name="tas" shape="time lat" type="float"><attribute name="_FillValue" type="float" value="-999" /></variable>
+      <variable name="pr" shape="time lat" type="short" />
+      <variable name="station" shape="lat" type="String" />
+    </netcdf>"""
+    ds = xncml.open_ncml(text)
+    assert ds.tas.chunks is not None
+    assert ds.tas.dtype == np.float32
+    assert float(ds.tas[-1, -1]) == -999
+    assert int(ds.pr[0, 0]) == -32767
+    assert ds.station[0].values == ""
+
+
+def test_declared_variable_fill_values_untyped():
+    text = """<netcdf xmlns="http://www.unidata.ucar.edu/namespaces/netcdf/ncml-2.2">
+      <dimension name="time" length="10" />
+      <variable name="tas" shape="time" type="float"><attribute name="_FillValue" value="-999.5" /></variable>
+      <variable name="pr" shape="time" type="short"><attribute name="_FillValue" value=" -1 " /></variable>
+    </netcdf>"""
+    ds = xncml.open_ncml(text)
+    assert ds.tas.dtype == np.float32
+    assert float(ds.tas[0]) == -999.5
+    assert int(ds.pr[-1]) == -1
+
+
+@pytest.mark.parametrize("value", ["abc", "1.5", "70000", "1 2"])
+def test_declared_variable_fill_values_invalid(value):
+    text = f"""<netcdf xmlns="http://www.unidata.ucar.edu/namespaces/netcdf/ncml-2.2">
+      <dimension name="time" length="10" />
+      <variable name="pr" shape="time" type="short"><attribute name="_FillValue" value="{value}" /></variable>
+    </netcdf>"""
+    with pytest.raises(ValueError, match="_FillValue"):
+        xncml.open_ncml(text)
+
+
+def test_variable_type_lazy(tmp_path):
+    xr.Dataset({"tas": (("time", "lat"), np.arange(12, dtype="int16").reshape(4, 3)), "flag": ("time", np.array([0, 1, 1, 0], "int8"))}).to_netcdf(
+        tmp_path / "tas.nc"
+    )
+    text = """<netcdf xmlns="http://www.unidata.ucar.edu/namespaces/netcdf/ncml-2.2" location="tas.nc">
+      <enumTypedef name="boolean" type="enum1"><enum key="0">false</enum><enum key="1">true</enum></enumTypedef>
+      <variable name="tas" type="double" />
+      <variable name="flag" typedef="boolean" />
+    </netcdf>"""
+    with xncml.open_ncml(text, base_path=tmp_path) as ds:
+        assert ds.tas.dtype == np.float64
+        assert not ds.tas.variable._in_memory
+        assert ds.flag.dtype.metadata["enum_name"] == "boolean"
+        assert not ds.flag.variable._in_memory
+        np.testing.assert_array_equal(ds.tas[1:3, 0], [3.0, 6.0])
+        assert ds.tas[1:3, 0].values.dtype == np.float64
+        assert ds.flag.values.dtype.metadata["enum"] == {"false": 0, "true": 1}
+
+        # The type of the file is not written back.
+        assert "dtype" not in ds.tas.encoding
+        ds.to_netcdf(tmp_path / "out.nc")
+    with xr.open_dataset(tmp_path / "out.nc") as out:
+        assert out.tas.dtype == np.float64
+        np.testing.assert_array_equal(out.tas, np.arange(12).reshape(4, 3))
+        assert out.flag.encoding["dtype"].metadata["enum_name"] == "boolean"
+
+
+def test_flatten_groups__conflicting_names():
+    groups = "".join(
+        f"""<group name="{group}">
+          <dimension name="x" length="1" />
+          {"".join(f'<variable name="{name}" shape="x" type="int"><values>{i}</values></variable>' for name in names)}
+        </group>"""
+        for i, (group, names) in enumerate([("a", ["tas_max", "tas"]), ("b", ["tas"]), ("c", ["tas_max", "tas"])])
+    )
+    text = f"""<netcdf xmlns="http://www.unidata.ucar.edu/namespaces/netcdf/ncml-2.2">{groups}</netcdf>"""
+    ds = xncml.open_ncml(text, group="*")
+    assert sorted(ds.data_vars) == ["tas", "tas__1", "tas__2", "tas_max", "tas_max__1"]
+    assert [ds[name].item() for name in ["tas", "tas__1", "tas__2", "tas_max", "tas_max__1"]] == [0, 1, 2, 0, 2]
+    assert ds.tas__1.attrs["group_path"] == "/b/"
+
+
+def test_flatten_groups__edits():
+    # Edits building a new dataset are kept when groups are flattened.
+    text = """<netcdf xmlns="http://www.unidata.ucar.edu/namespaces/netcdf/ncml-2.2" location="nc/jan.nc">
+      <remove type="variable" name="P"/>
+      <dimension name="lat2" orgName="lat"/>
+      <attribute name="title" value="Flattened"/>
+      <group name="g"><variable name="tas" type="int" shape=""><values>1</values></variable></group>
+    </netcdf>"""
+    ds = xncml.open_ncml(text, base_path=data, group="*")
+    assert "P" not in ds.variables
+    assert ds.sizes["lat2"] == 3
+    assert ds.attrs["title"] == "Flattened"
+    assert ds.tas.item() == 1
@@ -0,0 +1,83 @@
+from pathlib import Path
+
+import numpy as np
+import pytest
+import xarray as xr
+
+import xncml
+from xncml.plan import Plan
+
+
+data = Path(__file__).parent / "data"
+
+
+@pytest.fixture
+def ds():
+    return xr.Dataset(
+        {"tas": (("time", "x"), np.zeros((2, 3))), "pr": ("time", [1.0, 2.0])},
+        coords={"time": [0, 1], "lat": ("x", [10.0, 20.0, 30.0])},
+        attrs={"title": "test"},
+    )
+
+
+def edit(target):
+    """Apply the same edits to a dataset or a plan."""
+    target = target.rename({"tas": "air"})
+    target = target.rename_dims({"x": "y"})
+    target["lat"] = xr.Variable("y", [1.0, 2.0, 3.0], {"units": "degrees_north"})
+    target["new"] = xr.Variable(("time", "y"), np.ones((2, 3)))
+    target = target.drop_vars("pr")
+    target["pr"] = xr.Variable("time", [3.0, 4.0])
+    target.attrs["history"] = "edited"
+    return target
+
+
+def test_apply(ds):
+    expected = edit(ds.copy())
+    plan = edit(Plan(ds))
+    out = plan.apply()
+    assert out.identical(expected)
+    assert list(out.coords) == ["time", "lat"]
+    assert "pr" in ds
+    assert ds.attrs == {"title": "test"}
+
+
+def test_queries(ds):
+    plan = Plan(ds).rename_dims({"x": "y"})
+    assert plan["tas"].dims == ("time", "y")
+    assert plan.dims == {"time": 2, "y": 3}
+    assert "tas" in plan
+    assert plan.get("missing") is None
+    # Dimensions without coordinate are virtual variables, as with `xr.Dataset`.
+    np.testing.assert_array_equal(plan.get("y"), [0, 1, 2])
+
+    with pytest.raises(ValueError, match="conflicts"):
+        plan.rename({"tas": "pr"})
+    with pytest.raises(ValueError, match="cannot be found"):
+        plan.drop_vars("missing")
+
+
+def test_fused(ds):
+    plan = edit(Plan(ds))
+    fused = plan.fused()
+    assert fused["drop_vars"] == []
+    assert fused["rename_vars"] == {"tas": "air"}
+    assert fused["rename_dims"] == {"x": "y"}
+    assert list(fused["assign"]) == ["lat", "new", "pr"]
+    assert len(plan.steps) == 6
+
+
+def test_apply_closes(ds):
+    closed = []
+    ds.set_close(lambda: closed.append(True))
+    out = Plan(ds).drop_vars("pr").apply()
+    out.close()
+    assert closed == [True]
+
+
+def test_debug(monkeypatch, capsys):
+    monkeypatch.setenv("XNCML_DEBUG_PLAN", "1")
+    xncml.open_ncml(data / "modifyVars.xml")
+    err = capsys.readouterr().err
+    assert "<xncml.Plan:" in err
+    assert "Fused:" in err
@@ -0,0 +1,157 @@
+import datetime as dt
+import os
+import shutil
+import time
+from pathlib import Path
+
+import numpy as np
+import pytest
+import xarray as xr
+
+import xncml
+from xncml.scan import dates_from_names, matcher, parse_duration, walk
+
+
+data = Path(__file__).parent / "data"
+
+
+@pytest.fixture
+def tree(tmp_path):
+    for name in ["a.nc", "b.txt", "sub/c.nc", "sub/deep/d.nc", "sub/deep/e.nc4", "other/f.nc"]:
+        fn = tmp_path / name
+        fn.parent.mkdir(parents=True, exist_ok=True)
+        fn.touch()
+    (tmp_path / "empty.nc").mkdir()
+    return tmp_path
+
+
+def legacy(path: Path, subdirs: bool, suffix: str) -> list[str]:
+    import fnmatch
+
+    files = path.rglob("*") if subdirs else path.glob("*")
+    return sorted(fnmatch.filter(map(str, files), "*" + suffix))
+
+
+@pytest.mark.parametrize("parallel", [None, 3])
+@pytest.mark.parametrize("subdirs", [True, False])
+def test_walk_matches_glob(tree, subdirs, parallel):
+    entries, count = walk(tree, subdirs=subdirs, match=matcher(suffix=".nc"), parallel=parallel)
+    expected = [fn for fn in legacy(tree, subdirs, ".nc") if Path(fn).is_file()]
+    assert [e.path for e in entries] == expected
+    assert count == (6 if subdirs else 2)
+
+
+def test_walk_reg_exp(tree):
+    entries, _ = walk(tree, match=matcher(reg_exp=r".*/sub/.*\.nc4?$"))
+    assert [Path(e.path).name for e in entries] == ["c.nc", "d.nc", "e.nc4"]
+
+
+def test_walk_all(tree):
+    assert matcher() is None
+    entries, count = walk(tree)
+    assert len(entries) == count == 6
+
+
+def test_walk_error(tree):
+    with pytest.raises(FileNotFoundError):
+        walk(tree / "missing", parallel=2)
+
+
+@pytest.mark.parametrize(
+    "text,expected",
+    [
+        ("15 min", dt.timedelta(minutes=15)),
+        ("1 hour", dt.timedelta(hours=1)),
+        ("30sec", dt.timedelta(seconds=30)),
+        ("1.5 days", dt.timedelta(hours=36)),
+    ],
+)
+def test_parse_duration(text, expected):
+    assert parse_duration(text) == expected
+
+
+def test_parse_duration_error():
+    with pytest.raises(ValueError, match="Invalid duration"):
+        parse_duration("15 parsecs")
+
+
+def test_walk_modified_before(tree):
+    old = time.time() - 3600
+    os.utime(tree / "a.nc", (old, old))
+    entries, count = walk(tree, match=matcher(suffix=".nc"), modified_before=time.time() - 60)
+    assert [Path(e.path).name for e in entries] == ["a.nc"]
+    assert count == 6
+
+
+def test_scan_older_than(tmp_path):
+    ncml = tmp_path / "agg.ncml"
+    ncml.write_text(
+        """<?xml version="1.0" encoding="UTF-8"?>
+<netcdf xmlns="http://www.unidata.ucar.edu/namespaces/netcdf/ncml-2.2">
+  <aggregation dimName="time" type="joinExisting">
+    <scan location="." suffix=".nc" olderThan="5 min"/>
+  </aggregation>
+</netcdf>
+"""
+    )
+    for fn in ["jan.nc", "feb.nc"]:
+        shutil.copy(data / "nc" / fn, tmp_path / fn)
+    with pytest.raises(ValueError, match="no file older than 5 min"):
+        xncml.open_ncml(ncml)
+
+    old = time.time() - 3600
+    os.utime(tmp_path / "jan.nc", (old, old))
+    with xncml.open_ncml(ncml) as ds:
+        assert ds.sizes["time"] == 31
+
+    # Files are picked up once they are old enough.
+    with xncml.AggregatedDataset(ncml, manifest=tmp_path / "cache") as agg:
+        assert agg.dataset.sizes["time"] == 31
+        os.utime(tmp_path / "feb.nc", (old, old))
+        agg.refresh(force=True)
+        assert agg.dataset.sizes["time"] == 59
+
+
+@pytest.mark.parametrize("lazy_members", [False, True])
+def test_scan_missing_location(tmp_path, lazy_members):
+    text = """<netcdf xmlns="http://www.unidata.ucar.edu/namespaces/netcdf/ncml-2.2">
+      <aggregation dimName="time" type="joinExisting"><scan location="missing" suffix=".nc"/></aggregation>
+    </netcdf>"""
+    with pytest.raises(ValueError, match="No files found in"):
+        xncml.open_ncml(text, base_path=tmp_path, lazy_members=lazy_members)
+
+
+def test_dates_from_names():
+    dates = dates_from_names(["a/CG2006158_120000h_usfc.nc", "CG2006158_130000h_usfc.nc"], "CG#yyyyDDD_HHmmss")
+    np.testing.assert_array_equal(dates, np.array(["2006-06-07T12", "2006-06-07T13"], dtype="datetime64[ns]"))
+
+    dates = dates_from_names(["tas_x_20001231T06.nc"], "tas_x_#yyyyMMdd'T'HH")
+    assert dates[0] == np.datetime64("2000-12-31T06")
+
+    with pytest.raises(ValueError, match="does not match"):
+        dates_from_names(["tas_20001231.nc", "pr_20001231.nc"], "tas_#yyyyMMdd")
+
+    with pytest.raises(ValueError, match="Unsupported date format field"):
+        dates_from_names(["tas_Dec2000.nc"], "tas_#MMMyyyy")
+
+
+@pytest.mark.parametrize("lazy_members", [False, True])
+def test_scan_date_format_mark(tmp_path, lazy_members):
+    # Members are sorted by date rather than by name.
+    for date, fn in [("19991231", "jan.nc"), ("19991201", "feb.nc")]:
+        with xr.open_dataset(data / "nc" / fn, decode_times=False) as ds:
+            ds.isel(time=[0]).to_netcdf(tmp_path / f"{fn[0]}_{date}.nc")
+
+    ncml = tmp_path / "agg.ncml"
+    ncml.write_text(
+        """<?xml version="1.0" encoding="UTF-8"?>
+<netcdf xmlns="http://www.unidata.ucar.edu/namespaces/netcdf/ncml-2.2">
+  <aggregation dimName="time" type="joinExisting">
+    <scan location="." suffix=".nc" dateFormatMark="_#yyyyMMdd"/>
+  </aggregation>
+</netcdf>
+"""
+    )
+    with xncml.open_ncml(ncml, lazy_members=lazy_members) as ds:
+        np.testing.assert_array_equal(ds.time, np.array(["1999-12-01", "1999-12-31"], dtype="datetime64[ns]"))
+        assert ds.T.isel(time=0).values[0, 0] == 3100.0